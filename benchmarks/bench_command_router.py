@@ -0,0 +1,94 @@
+"""Compare the translate-bot command router with the per-command regex loop it replaced.
+
+Usage: python benchmarks/bench_command_router.py
+"""
+
+from pathlib import Path
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "translate-bot"))
+
+from utils import CommandRouter  # noqa: E402
+
+COMMAND_REGEXES = [
+    r"help$",
+    r"translate (?P<text>.*)$",
+    r"(?P<src>[a-z]{2})2(?P<dst>[a-z]{2}) (?P<text>.*)$",
+    r"wotd$",
+    r"wotd-words-left$",
+    r"languages$",
+    r"all-languages$",
+]
+ADMIN_COMMAND_REGEXES = [
+    r"help-admin$",
+    r"command-prefix(?P<prefix>.*)$",
+    r"server-language(?P<language>.*)$",
+    r"wotd-language(?P<language>.*)$",
+    r"wotd-channel(?P<channel>.*)$",
+]
+
+commands = [{"regex": regex} for regex in COMMAND_REGEXES]
+admin_commands = [{"regex": regex} for regex in ADMIN_COMMAND_REGEXES]
+
+
+def legacy_route(prefix: str, content: str):
+    for command in commands:
+        match = re.match(r"^" + re.escape(prefix) + command["regex"], content)
+        if match:
+            return (command, False, match)
+    for command in admin_commands:
+        match = re.match(r"^" + re.escape(prefix) + command["regex"], content)
+        if match:
+            return (command, True, match)
+    return None
+
+
+def generate_messages(count: int):
+    # mostly normal chat, with some commands and some messages that only look like a command
+    chat = [
+        "hello everyone, how are you doing today?",
+        "does anyone know what 'kiitos' means?",
+        "lol",
+        "I'm learning Finnish, it is hard but fun",
+        "see you tomorrow!",
+    ]
+    command_messages = [
+        "/translate hyvää huomenta",
+        "/fi2en minä olen väsynyt",
+        "/wotd-words-left",
+        "/help",
+        "/server-language fi",
+    ]
+    lookalikes = ["/shrug", "/ not a command", "/translatex"]
+    population = chat * 16 + command_messages * 3 + lookalikes
+    rng = random.Random(42)
+    return [rng.choice(population) for _ in range(count)]
+
+
+def main():
+    prefix = "/"
+    messages = generate_messages(10_000)
+    router = CommandRouter(commands, admin_commands)
+
+    # make sure that both implementations route every message to the same command
+    for message in messages:
+        legacy = legacy_route(prefix, message)
+        routed = router.route(prefix, message)
+        assert (legacy and legacy[0]) == (routed and routed[0]), message
+        if legacy and routed:
+            assert legacy[2].groupdict() == routed[2].groupdict(), message
+
+    number = 10
+    legacy_time = timeit.timeit(lambda: [legacy_route(prefix, m) for m in messages], number=number)
+    router_time = timeit.timeit(lambda: [router.route(prefix, m) for m in messages], number=number)
+    per_message = 1e6 / (number * len(messages))
+    print(f"legacy loop: {legacy_time * per_message:.3f} us/message")
+    print(f"router:      {router_time * per_message:.3f} us/message")
+    print(f"speedup:     {legacy_time / router_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Compare the report-manager-bot flagged words matcher with the per-word substring loop it replaced.
+
+Usage: python benchmarks/bench_word_matcher.py
+"""
+
+from pathlib import Path
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "report-manager-bot"))
+
+from utils import WordMatcher  # noqa: E402
+
+
+def legacy_find_all(flagged_words: list[str], content: str):
+    return {word for word in flagged_words if word in content.lower()}
+
+
+def generate_words(rng: random.Random, count: int):
+    return ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9))) for _ in range(count)]
+
+
+def generate_messages(rng: random.Random, words: list[str], count: int):
+    # chat messages of 20-200 characters, some of which contain a flagged word
+    messages = []
+    for _ in range(count):
+        text = " ".join(generate_words(rng, rng.randint(3, 30)))[:200]
+        if words and rng.random() < 0.05:
+            text += f" {rng.choice(words).upper()}"
+        messages.append(text)
+    return messages
+
+
+def main():
+    rng = random.Random(42)
+    for size in [10, 50, 100, 500, 1000]:
+        words = generate_words(rng, size)
+        messages = generate_messages(rng, words, 2_000)
+        matcher = WordMatcher(words)
+
+        # make sure that both implementations find the same words
+        for message in messages:
+            assert legacy_find_all(words, message) == matcher.find_all(message.lower()), message
+
+        number = 5
+        legacy_time = timeit.timeit(lambda: [legacy_find_all(words, m) for m in messages], number=number)
+        matcher_time = timeit.timeit(lambda: [matcher.find_all(m.lower()) for m in messages], number=number)
+        per_message = 1e6 / (number * len(messages))
+        print(
+            f"{size:5} words: legacy {legacy_time * per_message:8.2f} us/message, "
+            f"matcher {matcher_time * per_message:6.2f} us/message, "
+            f"speedup {legacy_time / matcher_time:5.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,45 @@
+import asyncio
 import discord
 import json
 import os
+import signal
 from pathlib import Path
 
 from discord import Message
 from discord import Member
+from discord import Role
+from discord.abc import GuildChannel
 from discord.ext.commands import Bot
 from discord.channel import TextChannel
 
+from utils import BackupStore
+from utils import DigestHit
+from utils import DuplicateEntry
+from utils import DuplicateIndex
+from utils import FlaggedDigest
+from utils import GuildConfig
+from utils import JoinQueue
+from utils import ReportQueue
+
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 assert DISCORD_TOKEN, f"FATAL: discord token 'DISCORD_TOKEN' not found in env!"
+# seconds that changes are collected before the backup is written to disk
+BACKUP_DELAY = float(os.getenv("BACKUP_DELAY", "2"))
+# store every guild in its own file in data/guilds/ instead of a single data/backup.json
+BACKUP_SHARDS = os.getenv("BACKUP_SHARDS", "0") == "1"
+# load guilds on first use and keep at most this many in memory (0 keeps all guilds in memory), implies shards
+BACKUP_CACHE_SIZE = int(os.getenv("BACKUP_CACHE_SIZE", "0"))
+# maximum number of reports waiting to be delivered, and the number of workers delivering them
+REPORT_QUEUE_SIZE = int(os.getenv("REPORT_QUEUE_SIZE", "1000"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "4"))
+# seconds that flagged word hits are collected before a guild in digest mode gets its digest
+DIGEST_WINDOW = float(os.getenv("DIGEST_WINDOW", "30"))
+# seconds that the same content is forwarded only once, and the maximum number of remembered contents
+DUPLICATE_WINDOW = float(os.getenv("DUPLICATE_WINDOW", "300"))
+DUPLICATE_MAX_ENTRIES = int(os.getenv("DUPLICATE_MAX_ENTRIES", "10000"))
+# a guild with more than JOIN_BURST_THRESHOLD joins within JOIN_BURST_WINDOW seconds gets its autoroles in batches
+JOIN_BURST_THRESHOLD = int(os.getenv("JOIN_BURST_THRESHOLD", "10"))
+JOIN_BURST_WINDOW = float(os.getenv("JOIN_BURST_WINDOW", "10"))
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -19,8 +49,10 @@ intents.members = True
 Path("data/").mkdir(exist_ok=True)
 
 # load data from disk
-with open("data/backup.json", "r") as f:
-    server_data: dict = json.load(f)
+shard_dir = "data/guilds" if BACKUP_SHARDS or BACKUP_CACHE_SIZE else None
+backup = BackupStore("data/backup.json", shard_dir=shard_dir, delay=BACKUP_DELAY)
+# the configuration of a guild that is dropped from memory is dropped as well
+server_data = backup.load(BACKUP_CACHE_SIZE, on_evict=lambda guild_id: configs.pop(guild_id, None))
 with open("data/help.json", "r") as f:
     help_cmds = json.load(f)
 
@@ -28,6 +60,9 @@ with open("data/help.json", "r") as f:
 command_prefix = "s!"
 activity = discord.Activity(type=discord.ActivityType.watching, name=f"'{command_prefix}help'")
 MIN_REPORT_LEN = 32
+# discord limits an embed to 25 fields and 6000 characters
+MAX_EMBED_FIELDS = 25
+MAX_EMBED_CHARS = 5500
 # some constants
 RED = discord.Color.from_rgb(254, 50, 50)
 ORANGE = discord.Color.from_rgb(254, 164, 0)
@@ -36,17 +71,46 @@ L_BLUE = discord.Color.from_rgb(0, 191, 254)
 # create the bot
 bot = Bot(command_prefix=command_prefix, activity=activity, intents=intents)
 
+# the (precomputed) configuration of every guild, rebuilt when the configuration changes
+configs: dict[str, GuildConfig] = {}
+# reports, deletions and replies are delivered in the background, so they don't hold back the message handling
+report_queue = ReportQueue(maxsize=REPORT_QUEUE_SIZE, workers=REPORT_WORKERS)
+# recently forwarded content, to suppress forwarding duplicates
+duplicates = DuplicateIndex(window=DUPLICATE_WINDOW, max_entries=DUPLICATE_MAX_ENTRIES)
+# new members waiting for their autorole
+join_queue = JoinQueue(
+    lambda member: assign_autorole(member),
+    burst_threshold=JOIN_BURST_THRESHOLD,
+    burst_window=JOIN_BURST_WINDOW,
+)
+# flagged word hits of guilds in digest mode, reported together
+digest = FlaggedDigest(lambda guild_id, hits: send_digest(guild_id, hits), window=DIGEST_WINDOW)
+
 
 @bot.event
 async def on_ready():  # setting bot activity
     name = bot.user.name if bot.user else bot.user
     print(f"{name} ({bot.user}) has connected to discord!")
+    report_queue.start()
+
+
+@bot.event
+async def setup_hook():
+    # docker stops the bot with SIGTERM, close the bot on it so bot.run returns and the backup is flushed at exit
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(bot.close()))
+    except NotImplementedError:
+        pass  # signal handlers are not supported on this platform
+
 
+async def save_backup(guild_id: str):
+    # the backup is written in the background, shortly after the last change
+    backup.mark_dirty(guild_id)
 
-async def save_backup():
-    with open("data/backup.json", "w") as f:  # save to data/backup.json
-        json.dump(server_data, f, indent=4)
-    return
+
+async def on_config_changed(guild_id: str):
+    update_config(guild_id)
+    await save_backup(guild_id)
 
 
 async def strip_duplicates(guild_id: str):
@@ -54,10 +118,30 @@ async def strip_duplicates(guild_id: str):
     server_data[guild_id]["flagged_words"] = list(set(server_data[guild_id]["flagged_words"]))
 
 
-async def send_report(message: Message, report):
+def get_config(guild_id: str):
+    if guild_id not in configs:
+        update_config(guild_id)
+    return configs[guild_id]
+
+
+def update_config(guild_id: str):
+    configs[guild_id] = GuildConfig(guild_id, server_data[guild_id], configs.get(guild_id))
+
+
+async def send_report(message: Message, report, flagged_words: set[str] | None = None):
     guild = message.guild
     if not guild:
         return
+    admin_chnl = get_config(str(guild.id)).admin_channel(guild)
+    if not admin_chnl:
+        return
+    admin_chnl: TextChannel = admin_chnl  # type:ignore
+
+    # forward the same content only once, copies update the counter on the forwarded message instead
+    entry = duplicates.record(str(guild.id), report, message.content)
+    if entry.count > 1:
+        schedule_seen_count_update(admin_chnl, entry)
+        return
 
     if report:
         title = "🚨   Report   🚨"
@@ -73,11 +157,81 @@ async def send_report(message: Message, report):
     embed.add_field(name="🧑  Author", value=message.author.mention, inline=False)
     embed.add_field(name="📑  Content", value=message.content, inline=False)
     embed.add_field(name="💬  Channel", value=channel.mention, inline=False)
+    if flagged_words:
+        embed.add_field(name="🚩  Flagged words", value=", ".join(sorted(flagged_words))[:1024], inline=False)
+
+    entry.embed = embed
+
+    def forget():
+        # the report couldn't be forwarded, so the next copy of the content is forwarded again
+        duplicates.forget(str(guild.id), report, message.content, entry)
+
+    if not report_queue.submit(admin_chnl.id, lambda: forward_report(admin_chnl, entry), forget):
+        forget()
+
 
-    admin_chnl = discord.utils.get(guild.channels, id=server_data[str(guild.id)]["admin"])  # type:ignore
-    if admin_chnl:
-        admin_chnl: TextChannel = admin_chnl
-        await admin_chnl.send(embed=embed)
+async def forward_report(admin_chnl: TextChannel, entry: DuplicateEntry):
+    assert entry.embed
+    count = entry.count
+    if count > 1:
+        entry.embed.set_footer(text=f"Seen {count} times")
+    entry.message = await admin_chnl.send(embed=entry.embed)
+    if entry.count != count:
+        # copies were seen while the message was being sent
+        schedule_seen_count_update(admin_chnl, entry)
+
+
+def schedule_seen_count_update(admin_chnl: TextChannel, entry: DuplicateEntry):
+    # a single pending update covers all copies that are seen until it is delivered
+    if not entry.edit_pending:
+        entry.edit_pending = True
+        if not report_queue.submit(admin_chnl.id, lambda: update_seen_count(entry)):
+            # the queue is full, the next copy schedules the update again
+            entry.edit_pending = False
+
+
+async def update_seen_count(entry: DuplicateEntry):
+    entry.edit_pending = False
+    if not entry.message or not entry.embed:
+        return  # the forwarded message isn't sent yet, it is sent with the current count
+    entry.embed.set_footer(text=f"Seen {entry.count} times")
+    await entry.message.edit(embed=entry.embed)
+
+
+def send_digest(guild_id: str, hits: list[DigestHit]):
+    guild = bot.get_guild(int(guild_id))
+    if not guild:
+        return
+    admin_chnl = get_config(guild_id).admin_channel(guild)
+    if not admin_chnl:
+        return
+    admin_chnl: TextChannel = admin_chnl  # type:ignore
+
+    # one field per hit, split over as many embeds as needed to stay within the embed limits
+    pages: list[list[tuple[str, str]]] = [[]]
+    page_chars = 0
+    for hit in hits:
+        count = f" (×{hit.count})" if hit.count > 1 else ""
+        name = f"💬  Message{count}"
+        value = f"<#{hit.channel_id}> by <@{hit.author_id}>\n{hit.content[:300]}\n🚩  {', '.join(sorted(hit.flagged_words))}"
+        value = value[:1024]
+        if len(pages[-1]) == MAX_EMBED_FIELDS or page_chars + len(name) + len(value) > MAX_EMBED_CHARS:
+            pages.append([])
+            page_chars = 0
+        pages[-1].append((name, value))
+        page_chars += len(name) + len(value)
+
+    total = sum(hit.count for hit in hits)
+    for i, fields in enumerate(pages):
+        page = f" ({i + 1}/{len(pages)})" if len(pages) > 1 else ""
+        embed = discord.Embed(
+            title=f"⚠️   Flagged Words Digest{page}   ⚠️",
+            description=f"{total} messages with flagged words have been found in the last {DIGEST_WINDOW:g} seconds.",
+            color=ORANGE,
+        )
+        for name, value in fields:
+            embed.add_field(name=name, value=value, inline=False)
+        report_queue.submit(admin_chnl.id, lambda embed=embed: admin_chnl.send(embed=embed))
 
 
 @bot.event
@@ -86,16 +240,39 @@ async def on_member_join(member: Member):
         return
 
     guild_id = str(member.guild.id)  # convert guild id to string for json file
+    if guild_id not in server_data:
+        return
+    config = get_config(guild_id)
 
-    if not server_data[guild_id]["autorole"]:  # return if autorole disabled (if autorole == None)
+    if not config.autorole:  # return if autorole disabled (if autorole == None)
         return
 
-    # add role to new user
-    autorole = server_data[guild_id]["autorole"]
-    guild_autorole = discord.utils.get(member.guild.roles, id=server_data[guild_id]["autorole"])
+    # the role is added by the join queue, so a mass join doesn't run into the rate limits
+    join_queue.submit(member)
+
+
+async def assign_autorole(member: Member):
+    # the autorole could have changed while the member was waiting in the queue
+    config = get_config(str(member.guild.id))
+    guild_autorole = config.autorole_role(member.guild)
     if not guild_autorole:
-        print(f"failed to assign role {autorole} to new member!")
-    await member.add_roles(autorole, reason="Automatically added upon joining the server.")
+        print(f"failed to assign role {config.autorole} to new member!")
+        return
+    await member.add_roles(guild_autorole, reason="Automatically added upon joining the server.")
+
+
+@bot.event
+async def on_guild_channel_delete(channel: GuildChannel):
+    guild_id = str(channel.guild.id)
+    if guild_id in configs:
+        configs[guild_id].forget_channel(channel.id)
+
+
+@bot.event
+async def on_guild_role_delete(role: Role):
+    guild_id = str(role.guild.id)
+    if guild_id in configs:
+        configs[guild_id].forget_role(role.id)
 
 
 @bot.event
@@ -112,17 +289,23 @@ async def on_message(message: Message):
         return
     guild_id = str(guild.id)  # convert guild id to string for json file
 
-    user_can_manage_messages = message.channel.permissions_for(message.author).manage_messages
-
     # check if guild added to server_data
-    if guild_id not in server_data.keys():
-        server_data[guild_id] = {}
-
-        await save_backup()
+    if guild_id not in server_data:
+        server_data[guild_id] = {
+            "report": None,
+            "admin": None,
+            "whitelist": [],
+            "flagged_words": [],
+            "autorole": None,
+            "digest": False,
+        }
+
+        await on_config_changed(guild_id)
 
     # commands
     if message.content.startswith(command_prefix):
         args = message.content.split(" ")
+        user_can_manage_messages = message.channel.permissions_for(message.author).manage_messages
 
         if args[0] == f"{command_prefix}set" and user_can_manage_messages:
             embed = discord.Embed()
@@ -132,14 +315,14 @@ async def on_message(message: Message):
                 server_data[guild_id]["report"] = int(args[2][2:-1])
                 server_data[guild_id]["admin"] = int(args[4][2:-1])
 
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Channels set!"
-                report_channel = discord.utils.get(guild.channels, id=server_data[guild_id]["report"])
+                report_channel = guild.get_channel(server_data[guild_id]["report"])
                 if not report_channel:
                     print(f'report_channel: {server_data[guild_id]["report"]} does not exist!')
                     return
-                admin_channel = discord.utils.get(guild.channels, id=server_data[guild_id]["admin"])
+                admin_channel = guild.get_channel(server_data[guild_id]["admin"])
                 if not admin_channel:
                     print(f'admin_channel: {server_data[guild_id]["admin"]} does not exist!')
                     return
@@ -153,7 +336,7 @@ async def on_message(message: Message):
                     server_data[guild_id]["flagged_words"].append(word.lower())
 
                 await strip_duplicates(guild_id)
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Flagged words set!"
                 embed.description = f"New `flagged words` list has been created. You can see the new `flagged words` list under the command `{command_prefix}show flagged words`.\n\nOld configuration has been erased."
@@ -166,7 +349,7 @@ async def on_message(message: Message):
                     server_data[guild_id]["whitelist"].append(int(channel[2:-1]))
 
                 await strip_duplicates(guild_id)
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Whitelist set!"
                 embed.description = f"New whitelist has been created. You can see the new whitelist under the command `{command_prefix}show whitelist`.\n\nOld configuration has been erased."
@@ -176,12 +359,30 @@ async def on_message(message: Message):
             elif args[1] == "autorole":
                 server_data[guild_id]["autorole"] = int(args[2][3:-1])
 
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Autorole set!"
                 embed.description = f"New autorole has been created. You can see the new autorole under the command `{command_prefix}show autorole`.\n\nOld configuration has been erased."
                 embed.color = L_BLUE
 
+            # enable or disable the digest of flagged words
+            elif args[1] == "digest" and args[2] in ("on", "off"):
+                server_data[guild_id]["digest"] = args[2] == "on"
+
+                await on_config_changed(guild_id)
+                # report the hits that were already collected
+                digest.flush(guild_id)
+
+                if server_data[guild_id]["digest"]:
+                    embed.title = "Digest enabled!"
+                    embed.description = (
+                        f"Messages with flagged words will be reported together, every {DIGEST_WINDOW:g} seconds."
+                    )
+                else:
+                    embed.title = "Digest disabled!"
+                    embed.description = "Every message with flagged words will be reported right away."
+                embed.color = L_BLUE
+
             await message.channel.send(embed=embed)
 
         elif args[0] == f"{command_prefix}add" and user_can_manage_messages:
@@ -193,7 +394,7 @@ async def on_message(message: Message):
                     server_data[guild_id]["flagged_words"].append(word.lower())
 
                 await strip_duplicates(guild_id)
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Flagged words added!"
                 embed.description = f"New flagged words have been added to the `flagged words` list. You can see the new `flagged words` list under the command `{command_prefix}show flagged words`."
@@ -205,7 +406,7 @@ async def on_message(message: Message):
                     server_data[guild_id]["whitelist"].append(int(channel[2:-1]))
 
                 await strip_duplicates(guild_id)
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Channels added!"
                 embed.description = f"New channels have been added to the whitelist. You can see the new whitelist under the command `{command_prefix}show whitelist`."
@@ -222,7 +423,7 @@ async def on_message(message: Message):
                     if word in server_data[guild_id]["flagged_words"]:
                         server_data[guild_id]["flagged_words"].remove(word)
 
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Flagged words removed!"
                 embed.description = f"Specified flagged words have been removed from the `flagged words` list. You can see the new `flagged words` list under the command `{command_prefix}show flagged words`."
@@ -234,7 +435,7 @@ async def on_message(message: Message):
                     if int(channel[2:-1]) in server_data[guild_id]["whitelist"]:
                         server_data[guild_id]["whitelist"].remove(int(channel[2:-1]))
 
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Channels removed!"
                 embed.description = f"Specified channels have been removed from the whitelist. You can see the new whitelist under the command `{command_prefix}show whitelist`."
@@ -244,7 +445,7 @@ async def on_message(message: Message):
             elif args[1] == "autorole":
                 server_data[guild_id]["autorole"] = None
 
-                await save_backup()
+                await on_config_changed(guild_id)
 
                 embed.title = "Autorole removed!"
                 embed.description = f"Autorole has been disabled. New members will not be given any roles from now on."
@@ -263,7 +464,7 @@ async def on_message(message: Message):
                 # we assume that all channels configured exist and have a mention
                 channel_names = []
                 for whitelist_channel in server_data[guild_id]["whitelist"].copy():
-                    channel = discord.utils.get(guild.channels, id=whitelist_channel)
+                    channel = guild.get_channel(whitelist_channel)
                     if channel:
                         channel_names.append(channel.mention)
                     else:
@@ -271,7 +472,7 @@ async def on_message(message: Message):
                         print(f"removing broken channel {whitelist_channel}...")
                         try:
                             server_data[guild_id]["whitelist"].remove(whitelist_channel)
-                            await save_backup()
+                            await on_config_changed(guild_id)
                             print("removed channel!")
                         except:
                             print("channel removal failed!")
@@ -285,9 +486,36 @@ async def on_message(message: Message):
                 description = f"Autorole disabled. See `{command_prefix}help admin` for more information."
 
                 if server_data[guild_id]["autorole"]:
-                    autorole = discord.utils.get(guild.roles, id=server_data[guild_id]["autorole"])
+                    autorole = guild.get_role(server_data[guild_id]["autorole"])
                     if autorole:
                         description = f"Current autorole: *{autorole.name}*\n\nThis role will automatically be assigned to new members."
+
+            # show how far behind the delivery of reports is
+            elif args[1] == "queue":
+                stats = report_queue.stats()
+                title = "Report queue"
+                description = (
+                    f"Waiting: {stats['depth']}\n"
+                    f"Delivered: {stats['delivered']}\n"
+                    f"Dropped: {stats['dropped']}\n"
+                    f"Failed: {stats['failed']}\n"
+                    f"Retries: {stats['retries']}\n"
+                    f"Suppressed duplicates: {duplicates.suppressed}\n"
+                    f"Average latency: {stats['avg_latency']:.2f}s\n"
+                    f"Maximum latency: {stats['max_latency']:.2f}s"
+                )
+            # show how far behind the autorole assignment is
+            elif args[1] == "joins":
+                stats = join_queue.stats()
+                title = "Join queue"
+                description = (
+                    f"Waiting: {stats['backlog']}\n"
+                    f"Raid mode: {'on' if join_queue.in_burst(guild.id) else 'off'}\n"
+                    f"Assigned: {stats['assigned']}\n"
+                    f"Failed: {stats['failed']}\n"
+                    f"Average time to role: {stats['avg_time_to_role']:.2f}s\n"
+                    f"Maximum time to role: {stats['max_time_to_role']:.2f}s"
+                )
             # invalid/not implemented command
             else:
                 return
@@ -324,14 +552,15 @@ async def on_message(message: Message):
 
         return  # don't perform checks on a command
 
+    config = get_config(guild_id)
+
     # check for whitelisted channels, ignore if channel on whitelist
-    for chnl in server_data[guild_id]["whitelist"]:
-        if message.channel.id == chnl:
-            return
+    if message.channel.id in config.whitelist:
+        return
 
     # if message in report channel, forward to admin channel
-    if message.channel.id == server_data[guild_id]["report"]:
-        await message.delete()
+    if message.channel.id == config.report:
+        report_queue.submit(message.channel.id, message.delete)
 
         if len(message.content) <= MIN_REPORT_LEN:
             title = "Your report has not been submitted."
@@ -342,15 +571,17 @@ async def on_message(message: Message):
             await send_report(message, True)
 
         embed = discord.Embed(title=title, description=description, color=L_BLUE)
-        await message.author.send(embed=embed)
+        report_queue.submit(message.author.id, lambda: message.author.send(embed=embed))
 
         return
 
     # if flagged words in message, forward to admin channel
-    for word in server_data[guild_id]["flagged_words"]:
-        if word in message.content.lower():
-            await send_report(message, False)
-            return
+    flagged_words = config.matcher.find_all(message.content.lower())
+    if flagged_words:
+        if config.digest:
+            digest.add(guild_id, message.channel.id, message.author.id, message.content, flagged_words)
+        else:
+            await send_report(message, False, flagged_words)
 
 
 bot.run(DISCORD_TOKEN)
@@ -0,0 +1,23 @@
+from .backup_store import BackupStore
+from .duplicate_index import DuplicateEntry
+from .duplicate_index import DuplicateIndex
+from .flagged_digest import DigestHit
+from .flagged_digest import FlaggedDigest
+from .guild_config import GuildConfig
+from .join_queue import JoinQueue
+from .lazy_guild_data import LazyGuildData
+from .report_queue import ReportQueue
+from .word_matcher import WordMatcher
+
+__all__ = [
+    "BackupStore",
+    "DigestHit",
+    "DuplicateEntry",
+    "DuplicateIndex",
+    "FlaggedDigest",
+    "GuildConfig",
+    "JoinQueue",
+    "LazyGuildData",
+    "ReportQueue",
+    "WordMatcher",
+]
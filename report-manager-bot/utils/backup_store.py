@@ -0,0 +1,162 @@
+import asyncio
+import atexit
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import json
+import os
+from pathlib import Path
+
+from .lazy_guild_data import LazyGuildData
+
+
+# persists server_data in the background: changes are marked dirty, coalesced for a while and then
+# serialized and written in a worker thread, so the event loop never blocks on writing the backup
+# stores everything in a single file, or with shard_dir set, every guild in its own file in that directory
+# (then only the guilds that changed are written, and the guilds can be loaded lazily)
+class BackupStore:
+    def __init__(self, filename="data/backup.json", shard_dir: str | None = None, delay=2.0):
+        self.filename = filename
+        self.shard_dir = shard_dir
+        self.delay = delay
+        self.data: dict[str, dict] | LazyGuildData = {}
+        self._dirty: set[str] = set()
+        # the snapshots of the guilds that are being written by the writer thread
+        self._in_flight: dict[str, dict] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # a single writer thread, so that consecutive writes of the same file are written in order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup-writer")
+        # make sure that pending changes are written to disk when the bot exits (also after a SIGTERM,
+        # as long as the bot closes on it so the interpreter exits normally)
+        atexit.register(self.flush)
+
+    def load(self, max_cached=0, on_evict: Callable[[str], None] | None = None):
+        # with shards and max_cached set, guilds are loaded on first use and at most max_cached are kept in memory
+        if not self.shard_dir:
+            self.data = self._read(self.filename) or {}
+            return self.data
+
+        if not self.guild_ids() and os.path.isfile(self.filename):
+            # first start with shards, split the single backup file into shards
+            self._write(self._read(self.filename) or {})
+        if max_cached:
+            self.data = LazyGuildData(self, max_cached, on_evict)
+        else:
+            self.data = {guild_id: guild for guild_id in self.guild_ids() if (guild := self.read_guild(guild_id))}
+        return self.data
+
+    def guild_ids(self):
+        assert self.shard_dir
+        return {Path(filename).stem for filename in glob.glob(f"{self.shard_dir}/*.json")}
+
+    def read_guild(self, guild_id: str) -> dict | None:
+        assert self.shard_dir
+        return self._read(f"{self.shard_dir}/{guild_id}.json")
+
+    def is_dirty(self, guild_id: str):
+        # whether the guild has changes that aren't written to disk yet
+        return guild_id in self._dirty or guild_id in self._in_flight
+
+    @staticmethod
+    def _read(filename: str):
+        try:
+            with open(filename, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def mark_dirty(self, guild_id: str):
+        self._dirty.add(guild_id)
+        if self._flush_handle:
+            # a write is already pending, this change will be written with it
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not running in an event loop, write the changes to disk immediately
+            self.flush()
+            return
+        self._flush_handle = loop.call_later(self.delay, self._flush_in_background)
+
+    def _flush_in_background(self):
+        self._flush_handle = None
+        # take the snapshot in the event loop, so the writer thread never sees data that is being changed
+        snapshot = self._take_snapshot()
+        if snapshot and self.shard_dir:
+            self._in_flight.update(snapshot)
+        self._writer.submit(self._write_in_background, snapshot, asyncio.get_running_loop())
+
+    def _write_in_background(self, snapshot: dict | None, loop: asyncio.AbstractEventLoop):
+        if self._write(snapshot):
+            return
+        assert snapshot
+        try:
+            # write the guilds again after a while
+            loop.call_soon_threadsafe(self._retry_write, list(snapshot))
+        except RuntimeError:
+            # the event loop is closed, the guilds are written by the flush at exit
+            self._dirty.update(snapshot)
+
+    def _retry_write(self, guild_ids: list[str]):
+        for guild_id in guild_ids:
+            self.mark_dirty(guild_id)
+
+    def flush(self):
+        # write all pending changes to disk, blocking until they are written
+        if self._flush_handle:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        try:
+            # wait for the already queued writes, so they can't overwrite these changes with older data
+            self._writer.submit(lambda: None).result()
+        except RuntimeError:
+            pass  # the writer is shut down at interpreter exit, after finishing its queued writes
+        snapshot = self._take_snapshot()
+        if not self._write(snapshot):
+            assert snapshot
+            self._dirty.update(snapshot)
+
+    def _take_snapshot(self):
+        if not self._dirty:
+            return None
+        # the guild data only contains lists as mutable values, so copying those is enough
+        guild_ids = self._dirty if self.shard_dir else self.data.keys()
+        snapshot = {
+            guild_id: {key: list(value) if isinstance(value, list) else value for key, value in guild.items()}
+            for guild_id in guild_ids
+            if (guild := self.data.get(guild_id)) is not None
+        }
+        self._dirty = set()
+        return snapshot
+
+    def _write(self, snapshot: dict | None):
+        # returns False when the snapshot couldn't be written, the caller marks its guilds dirty again
+        if snapshot is None:
+            return True
+        try:
+            if self.shard_dir:
+                for guild_id, guild_data in snapshot.items():
+                    self._write_file(f"{self.shard_dir}/{guild_id}.json", guild_data)
+                    if self._in_flight.get(guild_id) is guild_data:
+                        del self._in_flight[guild_id]
+            else:
+                self._write_file(self.filename, snapshot)
+        except Exception as e:
+            print(f"failed to write the backup: {e}")
+            # the guilds are not in flight anymore, so they can be evicted once they are written
+            for guild_id, guild_data in snapshot.items():
+                if self._in_flight.get(guild_id) is guild_data:
+                    del self._in_flight[guild_id]
+            return False
+        return True
+
+    @staticmethod
+    def _write_file(filename: str, data: dict):
+        # write to a temporary file first and rename it, so a crash never leaves a half written file behind
+        path = Path(filename)
+        path.parent.mkdir(parents=True, exist_ok=True)  # ensure the directory exists
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=4)
+        os.replace(tmp_path, path)
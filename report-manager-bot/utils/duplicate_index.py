@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import hashlib
+import time
+
+from discord import Embed
+from discord import Message
+
+
+# a forwarded message, with the number of times its content has been seen since
+class DuplicateEntry:
+    __slots__ = ("first_seen", "count", "embed", "message", "edit_pending")
+
+    def __init__(self, first_seen: float):
+        self.first_seen = first_seen
+        self.count = 1
+        # the embed and the message that forwarded the content to the admin channel
+        self.embed: Embed | None = None
+        self.message: Message | None = None
+        self.edit_pending = False
+
+
+# index of the content that was recently forwarded per guild, to suppress forwarding the same content again
+# only a hash of the content is kept, and entries expire after window seconds or when there are more
+# than max_entries, so the memory use doesn't grow with the uptime of the bot
+class DuplicateIndex:
+    def __init__(self, window=300.0, max_entries=10_000):
+        self.window = window
+        self.max_entries = max_entries
+        # ordered by the time the content was first seen, so the oldest entries are at the front
+        self._entries: OrderedDict[tuple[str, bool, bytes], DuplicateEntry] = OrderedDict()
+        self.suppressed = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(guild_id: str, report: bool, content: str):
+        # reports and flagged messages are forwarded separately, even when their content is the same
+        normalized = " ".join(content.lower().split())
+        return (guild_id, report, hashlib.blake2b(normalized.encode(), digest_size=16).digest())
+
+    def record(self, guild_id: str, report: bool, content: str):
+        # returns the entry of the content, its count is 1 when the content hasn't been seen within the window
+        now = time.monotonic()
+        self._expire(now)
+        key = self.key(guild_id, report, content)
+        entry = self._entries.get(key)
+        if entry:
+            entry.count += 1
+            self.suppressed += 1
+            return entry
+
+        entry = self._entries[key] = DuplicateEntry(now)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def forget(self, guild_id: str, report: bool, content: str, entry: DuplicateEntry):
+        # the content couldn't be forwarded, so its next copy is forwarded instead of only being counted
+        key = self.key(guild_id, report, content)
+        if self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def _expire(self, now: float):
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.first_seen < self.window:
+                break
+            self._entries.popitem(last=False)
@@ -0,0 +1,54 @@
+import asyncio
+from collections.abc import Callable
+
+
+# a message with flagged words, messages of the same author in the same channel with the same content are counted
+class DigestHit:
+    __slots__ = ("channel_id", "author_id", "content", "flagged_words", "count")
+
+    def __init__(self, channel_id: int, author_id: int, content: str, flagged_words: set[str]):
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.content = content
+        self.flagged_words = set(flagged_words)
+        self.count = 1
+
+
+# collects the flagged word hits of a guild for a while, and then hands them to flush all at once,
+# so a spam wave results in a single digest instead of one report per message
+class FlaggedDigest:
+    def __init__(self, flush: Callable[[str, list[DigestHit]], None], window=30.0):
+        self._flush = flush
+        self.window = window
+        # the hits of every guild, keyed on (channel, author, content)
+        self._hits: dict[str, dict[tuple[int, int, str], DigestHit]] = {}
+        self._flush_handles: dict[str, asyncio.TimerHandle] = {}
+
+    def add(self, guild_id: str, channel_id: int, author_id: int, content: str, flagged_words: set[str]):
+        hits = self._hits.setdefault(guild_id, {})
+        key = (channel_id, author_id, " ".join(content.lower().split()))
+        hit = hits.get(key)
+        if hit:
+            hit.count += 1
+            hit.flagged_words.update(flagged_words)
+        else:
+            hits[key] = DigestHit(channel_id, author_id, content, flagged_words)
+
+        # the first hit of a guild starts its window
+        if guild_id not in self._flush_handles:
+            loop = asyncio.get_running_loop()
+            self._flush_handles[guild_id] = loop.call_later(self.window, self.flush, guild_id)
+
+    def flush(self, guild_id: str):
+        handle = self._flush_handles.pop(guild_id, None)
+        if handle:
+            handle.cancel()
+        hits = self._hits.pop(guild_id, None)
+        if not hits:
+            return
+        # group the hits per channel and author
+        ordered = sorted(hits.values(), key=lambda hit: (hit.channel_id, hit.author_id))
+        try:
+            self._flush(guild_id, ordered)
+        except Exception as e:
+            print(str(e))  # print the exception for debugging purposes
@@ -0,0 +1,59 @@
+from discord import Guild
+from discord import Role
+from discord.abc import GuildChannel
+
+from .word_matcher import WordMatcher
+
+
+# read-only view on the configuration of a guild in server_data, with everything the message handling needs
+# precomputed, create a new one when the configuration changes
+class GuildConfig:
+    __slots__ = (
+        "guild_id",
+        "report",
+        "admin",
+        "whitelist",
+        "flagged_words",
+        "autorole",
+        "digest",
+        "matcher",
+        "_admin_channel",
+        "_autorole_role",
+    )
+
+    def __init__(self, guild_id: str, data: dict, previous: "GuildConfig | None" = None):
+        # previous is the config this one replaces, its matcher is reused when the flagged words didn't change
+        self.guild_id = guild_id
+        self.report: int | None = data.get("report")
+        self.admin: int | None = data.get("admin")
+        self.whitelist: frozenset[int] = frozenset(data.get("whitelist", []))
+        self.flagged_words: tuple[str, ...] = tuple(data.get("flagged_words", []))
+        self.autorole: int | None = data.get("autorole")
+        self.digest: bool = data.get("digest", False)
+        if previous and previous.flagged_words == self.flagged_words:
+            self.matcher = previous.matcher
+        else:
+            self.matcher = WordMatcher(self.flagged_words)
+        # the channel and role objects are resolved on first use
+        self._admin_channel: GuildChannel | None = None
+        self._autorole_role: Role | None = None
+
+    def admin_channel(self, guild: Guild):
+        if self._admin_channel is None and self.admin:
+            self._admin_channel = guild.get_channel(self.admin)
+        return self._admin_channel
+
+    def autorole_role(self, guild: Guild):
+        if self._autorole_role is None and self.autorole:
+            self._autorole_role = guild.get_role(self.autorole)
+        return self._autorole_role
+
+    def forget_channel(self, channel_id: int):
+        # drop the resolved channel when it is deleted, so it is resolved again
+        if self._admin_channel and self._admin_channel.id == channel_id:
+            self._admin_channel = None
+
+    def forget_role(self, role_id: int):
+        # drop the resolved role when it is deleted, so it is resolved again
+        if self._autorole_role and self._autorole_role.id == role_id:
+            self._autorole_role = None
@@ -0,0 +1,122 @@
+import asyncio
+from collections import deque
+from collections.abc import Awaitable
+from collections.abc import Callable
+import time
+
+from discord import HTTPException
+from discord import Member
+
+from .report_queue import retry_after
+
+
+# assigns the autorole of new members from a queue per guild, one member at a time at a steady pace,
+# during a burst of joins (more than burst_threshold joins within burst_window seconds) the members
+# are assigned in batches with a pause in between, to stay within the role assignment rate limits
+class JoinQueue:
+    def __init__(
+        self,
+        assign: Callable[[Member], Awaitable],
+        interval=0.2,
+        burst_threshold=10,
+        burst_window=10.0,
+        batch_size=5,
+        batch_interval=2.0,
+        max_retries=3,
+    ):
+        self._assign = assign
+        self.interval = interval
+        self.burst_threshold = burst_threshold
+        self.burst_window = burst_window
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_retries = max_retries
+        # the members waiting for their role (with the time they joined) and the recent joins of every guild
+        self._pending: dict[int, deque[tuple[Member, float]]] = {}
+        self._joins: dict[int, deque[float]] = {}
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.assigned = 0
+        self.failed = 0
+        self._total_time_to_role = 0.0
+        self.max_time_to_role = 0.0
+
+    @property
+    def backlog(self):
+        return sum(len(pending) for pending in self._pending.values())
+
+    def in_burst(self, guild_id: int):
+        joins = self._joins.get(guild_id)
+        if not joins:
+            return False
+        # slide the window
+        cutoff = time.monotonic() - self.burst_window
+        while joins and joins[0] < cutoff:
+            joins.popleft()
+        return len(joins) > self.burst_threshold
+
+    def submit(self, member: Member):
+        guild_id = member.guild.id
+        now = time.monotonic()
+        self._joins.setdefault(guild_id, deque()).append(now)
+        self._pending.setdefault(guild_id, deque()).append((member, now))
+
+        # every guild with pending members has a worker, which stops when all its members are assigned
+        task = self._tasks.get(guild_id)
+        if task is None or task.done():
+            self._tasks[guild_id] = asyncio.create_task(self._work(guild_id))
+
+    def stats(self):
+        return {
+            "backlog": self.backlog,
+            "assigned": self.assigned,
+            "failed": self.failed,
+            "avg_time_to_role": self._total_time_to_role / self.assigned if self.assigned else 0.0,
+            "max_time_to_role": self.max_time_to_role,
+        }
+
+    async def _work(self, guild_id: int):
+        pending = self._pending[guild_id]
+        while pending:
+            if self.in_burst(guild_id):
+                batch = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+                await asyncio.gather(*[self._assign_one(member, joined) for member, joined in batch])
+                await asyncio.sleep(self.batch_interval)
+            else:
+                member, joined = pending.popleft()
+                await self._assign_one(member, joined)
+                await asyncio.sleep(self.interval)
+
+        del self._pending[guild_id]
+        del self._tasks[guild_id]
+        # forget the guild once its recent joins have left the window
+        asyncio.get_running_loop().call_later(self.burst_window, self._forget_joins, guild_id)
+
+    def _forget_joins(self, guild_id: int):
+        if guild_id in self._pending:
+            return  # members joined since, their worker forgets the joins when it is done
+        self.in_burst(guild_id)
+        if not self._joins.get(guild_id):
+            self._joins.pop(guild_id, None)
+
+    async def _assign_one(self, member: Member, joined: float):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self._assign(member)
+            except HTTPException as e:
+                if e.status != 429 or attempt == self.max_retries:
+                    self.failed += 1
+                    print(f"failed to assign the autorole to {member}: {e}")
+                    return
+                # wait as long as discord asks for before trying again
+                await asyncio.sleep(max(retry_after(e), self.batch_interval))
+                continue
+            except Exception as e:
+                self.failed += 1
+                print(str(e))  # print the exception for debugging purposes
+                return
+
+            time_to_role = time.monotonic() - joined
+            self.assigned += 1
+            self._total_time_to_role += time_to_role
+            self.max_time_to_role = max(self.max_time_to_role, time_to_role)
+            return
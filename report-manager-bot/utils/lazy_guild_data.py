@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Mapping
+import itertools
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .backup_store import BackupStore
+
+
+# server_data that loads the data of a guild from the store on first use, and keeps only the max_cached
+# most recently used guilds in memory, guilds with changes that aren't written yet are never dropped
+class LazyGuildData(Mapping[str, dict]):
+    def __init__(self, store: "BackupStore", max_cached=1000, on_evict: Callable[[str], None] | None = None):
+        self._store = store
+        self.max_cached = max_cached
+        # called with the id of a guild that is dropped from memory
+        self.on_evict = on_evict
+        # the ids of all guilds in the store, so checking if a guild exists doesn't need to read it
+        self._index = store.guild_ids()
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+        self.loads = 0
+
+    def __getitem__(self, guild_id: str):
+        guild = self._cache.get(guild_id)
+        if guild is not None:
+            self._cache.move_to_end(guild_id)
+            return guild
+        if guild_id not in self._index:
+            raise KeyError(guild_id)
+
+        guild = self._store.read_guild(guild_id)
+        if guild is None:
+            self._index.discard(guild_id)
+            raise KeyError(guild_id)
+        self.loads += 1
+        self._cache[guild_id] = guild
+        self._evict()
+        return guild
+
+    def __setitem__(self, guild_id: str, guild: dict):
+        self._index.add(guild_id)
+        self._cache[guild_id] = guild
+        self._cache.move_to_end(guild_id)
+        self._evict()
+
+    def __contains__(self, guild_id):
+        return guild_id in self._index
+
+    def __iter__(self):
+        return iter(list(self._index))
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def cached(self):
+        return len(self._cache)
+
+    def _evict(self):
+        while len(self._cache) > self.max_cached:
+            # drop the least recently used guild that doesn't have unwritten changes, but never the guild
+            # that was just used, as the caller is about to use (and maybe change) it
+            for guild_id in itertools.islice(self._cache, len(self._cache) - 1):
+                if not self._store.is_dirty(guild_id):
+                    break
+            else:
+                return  # the other cached guilds have unwritten changes, they are dropped after they are written
+            del self._cache[guild_id]
+            if self.on_evict:
+                self.on_evict(guild_id)
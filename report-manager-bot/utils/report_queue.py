@@ -0,0 +1,155 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Hashable
+import random
+import time
+
+from discord import HTTPException
+
+
+def retry_after(e: HTTPException):
+    # the number of seconds discord asks to wait before trying again (0 when it doesn't say)
+    try:
+        return float(e.response.headers.get("Retry-After", 0))
+    except (AttributeError, TypeError, ValueError):
+        return 0.0
+
+
+# a queued job, with the number of times it has been tried
+class _Job:
+    __slots__ = ("key", "job", "on_failure", "queued_at", "attempt")
+
+    def __init__(self, key: Hashable, job: Callable[[], Awaitable], on_failure: Callable[[], None] | None):
+        self.key = key
+        self.job = job
+        self.on_failure = on_failure
+        self.queued_at = time.monotonic()
+        self.attempt = 0
+
+
+# delivers reports from a bounded queue with a pool of workers, so a burst of reports (like during a raid)
+# doesn't hold back the message handling, jobs are retried on rate limits and server errors
+# every job has a key (the channel it sends to), the jobs of a rate limited key are set aside until its backoff
+# has passed, so the workers keep delivering the jobs of the other keys in the meantime
+class ReportQueue:
+    def __init__(self, maxsize=1000, workers=4, max_retries=3, base_delay=1.0):
+        self.maxsize = maxsize
+        self.workers = workers
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self._queue: asyncio.Queue[_Job] | None = None
+        self._tasks: list[asyncio.Task] = []
+        # monotonic time until which a key is rate limited
+        self._blocked_until: dict[Hashable, float] = {}
+        # the number of jobs that are set aside until their key isn't rate limited anymore
+        self._deferred = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retries = 0
+        self._total_latency = 0.0
+        self.max_latency = 0.0
+
+    @property
+    def depth(self):
+        return (self._queue.qsize() if self._queue else 0) + self._deferred
+
+    def start(self):
+        # the queue is created here, so it belongs to the running event loop
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.maxsize)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(asyncio.create_task(self._work()))
+
+    def submit(self, key: Hashable, job: Callable[[], Awaitable], on_failure: Callable[[], None] | None = None):
+        # job creates a new coroutine for every attempt, returns False when the queue is full and the job is dropped
+        # on_failure is called when the job is given up on after it has been queued
+        if self._queue is None:
+            self.start()
+        try:
+            self._queue.put_nowait(_Job(key, job, on_failure))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"report queue is full, dropped a job for {key} ({self.dropped} dropped)")
+            return False
+        return True
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "retries": self.retries,
+            "avg_latency": self._total_latency / self.delivered if self.delivered else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+    async def _work(self):
+        assert self._queue
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                print(str(e))  # print the exception for debugging purposes
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, job: _Job):
+        delay = self._blocked_until.get(job.key, 0.0) - time.monotonic()
+        if delay > 0:
+            self._defer(job, delay)
+            return
+
+        try:
+            await job.job()
+        except HTTPException as e:
+            if not self._is_retryable(e) or job.attempt == self.max_retries:
+                self._give_up(job, e)
+                return
+            self.retries += 1
+            # back off exponentially (with jitter), or as long as discord asks for
+            backoff = max(self.base_delay * 2**job.attempt * random.uniform(0.5, 1.5), retry_after(e))
+            self._blocked_until[job.key] = time.monotonic() + backoff
+            job.attempt += 1
+            self._defer(job, backoff)
+            return
+        except Exception as e:
+            self._give_up(job, e)
+            return
+
+        latency = time.monotonic() - job.queued_at
+        self.delivered += 1
+        self._total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self._blocked_until.pop(job.key, None)
+
+    def _defer(self, job: _Job, delay: float):
+        # put the job back in the queue once its key may be sent to again, instead of holding up a worker
+        self._deferred += 1
+        asyncio.get_running_loop().call_later(delay, self._requeue, job)
+
+    def _requeue(self, job: _Job):
+        assert self._queue
+        self._deferred -= 1
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"report queue is full, dropped a job for {job.key} ({self.dropped} dropped)")
+            if job.on_failure:
+                job.on_failure()
+
+    def _give_up(self, job: _Job, e: Exception):
+        self.failed += 1
+        print(f"failed to deliver a job for {job.key}: {e}")
+        self._blocked_until.pop(job.key, None)
+        if job.on_failure:
+            job.on_failure()
+
+    @staticmethod
+    def _is_retryable(e: HTTPException):
+        return e.status == 429 or e.status >= 500
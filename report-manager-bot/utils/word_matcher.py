@@ -0,0 +1,58 @@
+from collections import deque
+
+# below this number of words, checking every word with 'in' is faster than the python scanning loop
+SMALL_LIST_SIZE = 32
+
+
+# finds all (lowercase) words of a list that occur in a text, in a single pass over the text (aho-corasick)
+class WordMatcher:
+    def __init__(self, words):
+        self.words = sorted(set(word for word in words if word))
+        self._transitions: list[dict[str, int]] = []
+        self._outputs: list[frozenset[str] | None] = []
+        if len(self.words) >= SMALL_LIST_SIZE:
+            self._build_automaton()
+
+    def _build_automaton(self):
+        # build the trie, state 0 is the root
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[set[str]] = [set()]
+        for word in self.words:
+            state = 0
+            for char in word:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state].add(word)
+
+        # compute the transitions of every state for all characters of the words (a dfa), so scanning is a
+        # single dict lookup per character, a character without transition goes back to the root
+        self._transitions: list[dict[str, int]] = [dict(goto[0])] + [{} for _ in range(len(goto) - 1)]
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            # a state inherits the transitions (and words) of its failure state, plus its own trie edges
+            self._transitions[state] = {**self._transitions[fail[state]], **goto[state]}
+            outputs[state] |= outputs[fail[state]]
+            for char, next_state in goto[state].items():
+                fail[next_state] = self._transitions[fail[state]].get(char, 0)
+                queue.append(next_state)
+        self._outputs = [frozenset(output) if output else None for output in outputs]
+
+    def find_all(self, text: str) -> set[str]:
+        # the text must be lowercase, like the words
+        if not self._transitions:
+            return {word for word in self.words if word in text}
+
+        found = set()
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            if outputs[state]:
+                found |= outputs[state]
+        return found
@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime
 import json
 import hashlib
@@ -5,25 +6,39 @@ import os
 from pathlib import Path
 import random
 import re
-import requests
 import time
 
 import discord
 from discord import Member
 from discord import Message
+from discord.abc import GuildChannel
 from discord.channel import TextChannel
-from discord.ext import tasks
 from discord.ext.commands import Bot
 from discord.ext.commands import Context
 
+from utils import CircuitBreaker
+from utils import CircuitOpenError
+from utils import Hotword
+from utils import HotwordEngine
+from utils import MorseEngine
+from utils import WorldBossCache
+from utils import WorldBossClient
+from utils import WorldBossNotifier
+from utils import WorldBossSubscription
+
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 API_KEY = os.getenv("API_KEY")
 API_URL_WB = os.getenv("API_URL_WB")
+# (optional) name of the guild that gets the notifications of an old single guild database
 DISCORD_GUILD = os.getenv("DISCORD_GUILD")
 assert DISCORD_TOKEN, f"FATAL: discord token 'DISCORD_TOKEN' not found in env!"
 assert API_KEY, f"FATAL: SMMO API 'API_KEY' not found in env!"
 assert API_URL_WB, f"FATAL: SMMO API 'API_URL_WB' not found in env!"
-assert DISCORD_GUILD, f"FATAL: discord target guild name 'DISCORD_GUILD' not found in env!"
+# seconds that the world boss data is fresh, and how long stale data is served while it is refreshed
+WB_CACHE_TTL = float(os.getenv("WB_CACHE_TTL", "300"))
+WB_CACHE_MAX_STALE = float(os.getenv("WB_CACHE_MAX_STALE", "3600"))
+# maximum number of guilds that are notified at the same time
+WB_NOTIFY_CONCURRENCY = int(os.getenv("WB_NOTIFY_CONCURRENCY", "8"))
 
 # make sure that the data directory exists
 Path("data/").mkdir(exist_ok=True)
@@ -35,29 +50,51 @@ intents.members = True
 # set the command prefix and the bot's status
 command_prefix = ">"
 activity = discord.Activity(type=discord.ActivityType.watching, name=f"'{command_prefix}help'")
+
+
+class SmmoBot(Bot):
+    async def close(self):
+        # bot.run closes the bot on exit, close the SMMO API session with it so its connections aren't leaked
+        await super().close()
+        await _wb_client.close()
+
+
 # create the bot
-bot = Bot(command_prefix=command_prefix, activity=activity, intents=intents)
+bot = SmmoBot(command_prefix=command_prefix, activity=activity, intents=intents)
 
 
 _bot_initialized = False
-_last_notified_boss = 0
-_notify_before_sec = 0
-_morse_dict = {}
+# the wb subscription of every guild, keyed on guild id
+_wb_subscriptions: dict[int, WorldBossSubscription] = {}
+_morse: MorseEngine | None = None
+_hotwords: HotwordEngine | None = None
 _wb_commands = {}
+_wb_client = WorldBossClient(API_URL_WB, API_KEY)
+# stop calling the SMMO API for a while when it keeps failing
+_wb_breaker = CircuitBreaker()
+# the world boss schedule only changes a few times a day, share the fetched data between all its users
+_wb_cache = WorldBossCache(
+    lambda: _wb_breaker.call(_wb_client.fetch),
+    ttl=WB_CACHE_TTL,
+    max_stale=WB_CACHE_MAX_STALE,
+)
 
 
 @bot.event
 async def on_ready():
     # create references to the (written) global data structures
     global _bot_initialized
-    global _morse_dict
+    global _morse
+    global _hotwords
     global _wb_commands
 
     _bot_initialized = True
     _unserialize_from_disk()
 
     with open("morse_dict.json") as f:
-        _morse_dict = json.load(f)
+        _morse = MorseEngine(json.load(f))
+    with open("hotwords.json") as f:
+        _hotwords = HotwordEngine(json.load(f))
 
     _wb_commands = {
         "next": {
@@ -70,6 +107,16 @@ async def on_ready():
             "help": "show all upcoming world bosses [info]",
             "admin": False,
         },
+        "subscribe": {
+            "func": _wb_subscribe,
+            "help": "send the wb notifications of this server to this channel or [channel]",
+            "admin": True,
+        },
+        "unsubscribe": {
+            "func": _wb_unsubscribe,
+            "help": "stop sending wb notifications to this server",
+            "admin": True,
+        },
         "notify-sec": {
             "func": _wb_notify_sec,
             "help": "set the number of seconds to notify before actual wb",
@@ -82,24 +129,20 @@ async def on_ready():
         },
     }
 
-    # start the background task
-    await smmo_bot_background_task.start()
+    # start the world boss notifications
+    _wb_notifier.start()
+    _wb_notifier.replan()
 
 
 def _serialize_to_disk():
     obj = {
-        "last_notified_boss": _last_notified_boss,
-        "notify_before_sec": _notify_before_sec,
+        "guilds": {str(guild_id): sub.to_dict() for guild_id, sub in _wb_subscriptions.items()},
     }
     with open("data/db.json", "w") as f:
         json.dump(obj, f)
 
 
 def _unserialize_from_disk():
-    # create references to the (written) global data structures
-    global _last_notified_boss
-    global _notify_before_sec
-
     try:
         with open("data/db.json", "r") as f:
             json.load(f)
@@ -111,8 +154,25 @@ def _unserialize_from_disk():
             json.dump({}, f)
     with open("data/db.json", "r") as f:
         obj: dict = json.load(f)
-        _last_notified_boss = obj.get("last_notified_boss", 0)
-        _notify_before_sec = obj.get("notify_before_sec", 0)
+
+    _wb_subscriptions.clear()
+    for guild_id, sub in obj.get("guilds", {}).items():
+        _wb_subscriptions[int(guild_id)] = WorldBossSubscription.from_dict(int(guild_id), sub)
+
+    if "guilds" not in obj and DISCORD_GUILD:
+        # the database of a single guild, subscribe that guild with its "events" channel
+        guild = discord.utils.get(bot.guilds, name=DISCORD_GUILD)
+        channel = next((c for c in guild.text_channels if "events" in c.name), None) if guild else None
+        if not guild or not channel:
+            print(f"failed to migrate the database to guild {DISCORD_GUILD}")
+            return
+        _wb_subscriptions[guild.id] = WorldBossSubscription(
+            guild.id,
+            channel.id,
+            obj.get("notify_before_sec", 0),
+            obj.get("last_notified_boss", 0),
+        )
+        _serialize_to_disk()
 
 
 @bot.event
@@ -123,82 +183,53 @@ async def on_message(message: Message):
     if message.author.bot:  # ignore bots
         return
 
-    # message from the creator
-    if "げんきですか" in message.content:
-        if "mahol" in message.content.lower() or "まほる" in message.content.lower():
-            if message.author.id == 151397544079917056:
-                await message.channel.send(f"はい、げんきです！")
-                await message.channel.send(f"(yes, I'm fine!)")
-                await message.channel.send(f":thumbsup:")
-            else:
-                await message.channel.send(f"you're not the creator/parent!")
+    # respond to the hotwords in the message
+    for hotword in _hotwords.match(message.content) if _hotwords else []:
+        await _respond_to_hotword(message, hotword)
+
+    await _try_morse(message)
+
+
+async def _respond_to_hotword(message: Message, hotword: Hotword):
+    assert _hotwords
+    if hotword.creator_only and message.author.id != _hotwords.creator:
+        for response in hotword.denied:
+            await message.channel.send(response)
+        return
 
     # make bot repeat a sentence
-    if message.author.id == 151397544079917056:
-        if "mahol, repeat:" in message.content:
-            output = message.content.replace("mahol, repeat:", "")
-            await message.channel.send(output.strip())
-            await message.delete()
-
-    hotword = None
-    if "KOOHII" in message.content or "コーヒー" in message.content:
-        hotword = "KOOHII"
-    elif "COFFEE" in message.content:
-        hotword = "COFFEE"
-    elif "TEA" in message.content:
-        hotword = "TEA"
-
-    if hotword:
-        if hotword == "KOOHII":
-            await message.channel.send(f"コーヒーおください")
-        else:
-            if "?" in message.content:
-                await message.channel.send("What an absurd question. " f"Absolutely it's time for {hotword}, always!")
-            else:
-                await message.channel.send(f"Did someone mention {hotword}??")
-        emoji_list = [
-            742343615497502750,
-            742131952634560573,
-            745579354934870117,
-            745579356234973204,
-            745579357074096249,
-        ]
-        emoji = random.choice(emoji_list)
-        await message.channel.send(f"{bot.get_emoji(emoji)}")
+    if hotword.action == "repeat":
+        output = message.content
+        for trigger in hotword.triggers:
+            output = output.replace(trigger, "")
+        await message.channel.send(output.strip())
+        await message.delete()
+        return
 
-    await _try_morse(message)
+    responses = hotword.question_responses if "?" in message.content else hotword.responses
+    for response in responses:
+        await message.channel.send(response.format(name=hotword.name))
+    if hotword.emoji and _hotwords.emojis:
+        emoji = random.choice(_hotwords.emojis)
+        await message.channel.send(f"{bot.get_emoji(emoji)}")
 
 
 async def _try_morse(message: Message):
-    match = re.match(
-        r">morse\s*(dot=(?P<dot>[^\s]))?\s*(dash=(?P<dash>[^\s]))?\s*" r"(?P<morse>.*)",
-        message.content,
-    )
-
-    if not match:
+    # cheap check first, most messages are not a morse command
+    command = _morse.parse(message.content) if _morse else None
+    if not command:
         return
+    assert _morse
 
-    gd = match.groupdict()
+    decode, text, dot, dash = command
+    if decode:
+        fields = [("Morse", text), ("Translation", _morse.decode(text, dot, dash))]
+    else:
+        fields = [("Text", text), ("Translation", _morse.encode(text, dot, dash))]
 
-    output = ""
-    for letter in gd["morse"]:
-        if _morse_dict.get(letter.lower()):
-            morse = _morse_dict.get(letter.lower(), "")
-            translate_dict = {
-                ".": gd.get("dot") or ".",
-                "-": gd.get("dash") or "-",
-            }
-            morse = "".join([translate_dict.get(i, "") for i in morse])
-        else:
-            morse = letter
-        output += morse + " " * 3
-
-    output = f"`{output.strip()}`"
-    embed = (
-        discord.Embed(title="Morse")
-        .add_field(name="Text", value=f'`{gd["morse"]}`', inline=False)
-        .add_field(name="Translation", value=output, inline=False)
-    )
+    embed = discord.Embed(title="Morse")
+    for name, value in fields:
+        embed.add_field(name=name, value=f"`{value}`", inline=False)
     await message.channel.send(embed=embed)
 
 
@@ -414,7 +445,9 @@ async def _print_wb_help(ctx: Context):
 
 
 async def _wb_cmd_next(ctx: Context, args):
-    data = _fetch_wb_data()
+    data = await _fetch_wb_data_or_reply(ctx)
+    if data is None:
+        return
     if data:
         next_wb = data[0]
         show_info = len(args) > 1 and args[1] == "info"
@@ -422,30 +455,74 @@ async def _wb_cmd_next(ctx: Context, args):
     else:
         msg = "there are currently no world bosses available"
 
-    await ctx.send(msg)
+    await ctx.send(msg + _wb_stale_note())
 
 
 async def _wb_cmd_all(ctx: Context, args):
-    data = _fetch_wb_data()
+    data = await _fetch_wb_data_or_reply(ctx)
+    if data is None:
+        return
     info = len(args) > 1 and args[1] == "info"
     msg = "\n".join([_wb_generate_msg(d, False, info) for d in data])
     if not msg:
         msg = "there are currently no world bosses available"
-    await ctx.send(msg)
+    await ctx.send(msg + _wb_stale_note())
 
 
-async def _wb_notify_sec(ctx: Context, args):
-    # create references to the (written) global data structures
-    global _notify_before_sec
+def _wb_stale_note():
+    # tell the user that the data is old when the SMMO API is failing
+    if not _wb_breaker.is_open or _wb_cache.age <= WB_CACHE_TTL:
+        return ""
+    return f"\n*the SMMO API is unavailable, this is the data of {_wb_cache.age // 60:.0f} minutes ago*"
+
+
+async def _wb_subscribe(ctx: Context, args):
+    assert ctx.guild
+    channel = ctx.channel
+    if len(args) > 1:
+        match = re.fullmatch(r"<#(?P<channel_id>[0-9]+)>", args[1])
+        channel = ctx.guild.get_channel(int(match["channel_id"])) if match else None
+        if not isinstance(channel, TextChannel):
+            await ctx.send("wb subscribe: ERROR: invalid channel supplied!")
+            return
+
+    sub = _wb_subscriptions.get(ctx.guild.id)
+    if sub:
+        sub.channel_id = channel.id
+        sub.forget_channel()
+    else:
+        sub = WorldBossSubscription(ctx.guild.id, channel.id)
+        # don't notify about the wbs that are already due
+        data = _wb_cache.data or []
+        sub.last_notified_boss = max([wb["enable_time"] for wb in data if wb["enable_time"] <= time.time()], default=0)
+        _wb_subscriptions[ctx.guild.id] = sub
+    _serialize_to_disk()
+    _wb_notifier.replan()
+    await ctx.send(f"wb subscribe: notifications will be sent to <#{channel.id}>")
 
+
+async def _wb_unsubscribe(ctx: Context, args):
+    assert ctx.guild
+    if _wb_subscriptions.pop(ctx.guild.id, None):
+        _serialize_to_disk()
+        _wb_notifier.replan()
+    await ctx.send("wb unsubscribe: notifications will no longer be sent to this server")
+
+
+async def _wb_notify_sec(ctx: Context, args):
+    assert ctx.guild
+    sub = _wb_subscriptions.get(ctx.guild.id)
     message = "wb notify-sec: "
-    if len(args) < 2:
-        message += f"{_notify_before_sec} seconds"
+    if not sub:
+        message += f"ERROR: this server is not subscribed, use `{command_prefix}wb subscribe` first!"
+    elif len(args) < 2:
+        message += f"{sub.notify_before_sec} seconds"
     else:
         try:
             sec = int(args[1])
-            _notify_before_sec = sec
+            sub.notify_before_sec = sec
             _serialize_to_disk()
+            _wb_notifier.replan()
             message += f"set notify-before-sec to {sec} seconds"
         except:
             message += "ERROR: invalid argument supplied!"
@@ -454,52 +531,61 @@ async def _wb_notify_sec(ctx: Context, args):
 
 
 async def _wb_perform_notify_task(ctx: Context | None, args):
-    # create references to the (written) global data structures
-    global _last_notified_boss
+    data = await _fetch_wb_data_or_reply(ctx) if ctx else await _fetch_wb_data()
+    if data is not None:
+        await _wb_notify(data)
 
-    next_wb = _next_wb_to_notify()
-    if not next_wb:
-        return  # no wb available
 
-    server_time = round(time.time())
-    diff = next_wb["enable_time"] - server_time
-    if diff > _notify_before_sec:
-        return  # don't notify (yet) for next wb
+async def _fetch_wb_data():
+    return await _wb_cache.get()
 
-    # store this enable_time as last notified wb time
-    _last_notified_boss = next_wb["enable_time"]
-    _serialize_to_disk()
 
-    # notify about wb
-    message = _wb_generate_msg(next_wb, True)
-    guild = discord.utils.get(bot.guilds, name=DISCORD_GUILD)
-    if not guild:
-        print(f"FATAL: bot not connected to guild {DISCORD_GUILD}")
-        return
+async def _fetch_wb_data_or_reply(ctx: Context):
+    # the cached data is served while the SMMO API fails, this only fails when nothing has been fetched yet
+    try:
+        return await _fetch_wb_data()
+    except Exception as e:
+        if not isinstance(e, CircuitOpenError):
+            print(str(e))  # print the exception for debugging purposes
+    # the failed fetch may have opened the circuit, then the next fetch is tried once it closes again
+    retry_in = max(_wb_breaker.open_until - time.monotonic(), 1)
+    await ctx.send(f"the SMMO API is currently unavailable, retry in {retry_in:.0f}s")
+    return None
+
 
-    # this is only performed for TextChannel channels
-    channel: TextChannel = list(filter(lambda g: "events" in g.name, guild.channels))[0]  # type:ignore
-    await channel.send(message)
+def _wb_notify_time(data: list[dict]):
+    # the time at which the next wb must be notified in any of the guilds
+    notify_times = [sub.notify_time(data) for sub in _wb_subscriptions.values()]
+    return min([t for t in notify_times if t is not None], default=None)
 
 
-def _fetch_wb_data():
-    result = requests.post(f"{API_URL_WB}?api_key={API_KEY}")
-    data: list = json.loads(result.content.decode("utf-8"))
-    # remove test bosses that have name 'Test'
-    data = list(filter(lambda entry: entry["name"] != "Test", data))
-    # sort on enable_time
-    data.sort(key=lambda a: a["enable_time"])
-    return data
+async def _wb_notify(data: list[dict]):
+    # notify all guilds that are due at the same time, with a bounded number of messages in flight
+    now = time.time()
+    due = [sub for sub in _wb_subscriptions.values() if (t := sub.notify_time(data)) is not None and t <= now]
+    if not due:
+        return  # don't notify (yet) for next wb
 
+    semaphore = asyncio.Semaphore(WB_NOTIFY_CONCURRENCY)
 
-def _next_wb_to_notify():
-    # return the first wb that has enable_time larger than last notified
-    for wb in _fetch_wb_data():
-        if wb["enable_time"] > _last_notified_boss:
-            return wb
+    async def notify(sub: WorldBossSubscription):
+        next_wb = sub.next_wb(data)
+        assert next_wb
+        # store this enable_time as last notified wb time
+        sub.last_notified_boss = next_wb["enable_time"]
 
-    # return None if we didn't find a wb
-    return None
+        channel = sub.channel(bot)
+        if not channel:
+            print(f"wb notification channel {sub.channel_id} of guild {sub.guild_id} not found")
+            return
+        async with semaphore:
+            await channel.send(_wb_generate_msg(next_wb, True))
+
+    results = await asyncio.gather(*[notify(sub) for sub in due], return_exceptions=True)
+    _serialize_to_disk()
+    for result in results:
+        if isinstance(result, Exception):
+            print(str(result))  # print the exception for debugging purposes
 
 
 # timestamp to datetime (server time)
@@ -524,6 +610,13 @@ def _wb_generate_msg(wb, wb_is_next, show_info=False):
     )
 
 
+@bot.event
+async def on_guild_channel_delete(channel: GuildChannel):
+    sub = _wb_subscriptions.get(channel.guild.id)
+    if sub and sub.channel_id == channel.id:
+        sub.forget_channel()
+
+
 # hook to log errors to file
 @bot.event
 async def on_error(event, *args, **kwargs):
@@ -532,17 +625,8 @@ async def on_error(event, *args, **kwargs):
         f.write(f"Unhandled exception: {event} {args}, {kwargs}\n")
 
 
-@tasks.loop(seconds=2.0)
-async def smmo_bot_background_task():
-    if not bot.is_ready():
-        return
-
-    # perform logics here
-    try:
-        # handle wb notifications
-        await _wb_perform_notify_task(None, None)
-    except Exception as e:
-        print(str(e))  # print the exception for debugging purposes
+# sleeps until the next wb notification, planned on the cached wb data
+_wb_notifier = WorldBossNotifier(_wb_cache, _wb_notify_time, _wb_notify)
 
 
 bot.run(DISCORD_TOKEN)
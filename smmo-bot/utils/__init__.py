@@ -0,0 +1,23 @@
+from .circuit_breaker import CircuitBreaker
+from .circuit_breaker import CircuitOpenError
+from .hotwords import Hotword
+from .hotwords import HotwordEngine
+from .morse import MorseEngine
+from .world_boss_cache import WorldBossCache
+from .world_boss_client import WorldBossClient
+from .world_boss_client import WorldBossError
+from .world_boss_notifier import WorldBossNotifier
+from .world_boss_subscription import WorldBossSubscription
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "Hotword",
+    "HotwordEngine",
+    "MorseEngine",
+    "WorldBossCache",
+    "WorldBossClient",
+    "WorldBossError",
+    "WorldBossNotifier",
+    "WorldBossSubscription",
+]
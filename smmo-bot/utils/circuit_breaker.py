@@ -0,0 +1,91 @@
+from collections import deque
+from collections.abc import Awaitable
+from collections.abc import Callable
+import random
+import time
+from typing import TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+# stops calling a failing upstream for a while: the circuit opens after failure_threshold consecutive failures,
+# or when more than max_error_rate of the last window calls failed, and calls are rejected until the backoff
+# (exponential with jitter, at most max_delay) has passed, then a single trial call decides whether it closes again
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        max_error_rate: float = 0.5,
+        window: int = 20,
+        base_delay: float = 10.0,
+        max_delay: float = 600.0,
+    ):
+        self.failure_threshold = failure_threshold
+        self.max_error_rate = max_error_rate
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.state = self.CLOSED
+        # the outcomes of the last calls, True for a failure
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._consecutive_failures = 0
+        # the number of times the circuit opened since it was last closed, for the exponential backoff
+        self._opened = 0
+        self.open_until = 0.0
+        self.rejected = 0
+
+    @property
+    def is_open(self):
+        return self.state != self.CLOSED
+
+    async def call(self, func: Callable[[], Awaitable[T]]) -> T:
+        if self.state == self.HALF_OPEN or (self.state == self.OPEN and time.monotonic() < self.open_until):
+            # reject the call while the circuit is open, or while the trial call is running
+            self.rejected += 1
+            raise CircuitOpenError(f"circuit is open, retrying in {max(self.open_until - time.monotonic(), 0):.0f}s")
+        if self.state == self.OPEN:
+            self.state = self.HALF_OPEN
+
+        try:
+            result = await func()
+        except Exception:
+            self._on_failure()
+            raise
+        except BaseException:
+            # a cancelled trial call doesn't tell whether the upstream recovered, let the next call try again
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+            raise
+        self._on_success()
+        return result
+
+    def _on_success(self):
+        self.state = self.CLOSED
+        self._outcomes.append(False)
+        self._consecutive_failures = 0
+        self._opened = 0
+
+    def _on_failure(self):
+        self._outcomes.append(True)
+        self._consecutive_failures += 1
+        error_rate = sum(self._outcomes) / len(self._outcomes)
+        if (
+            self.state == self.HALF_OPEN
+            or self._consecutive_failures >= self.failure_threshold
+            or (len(self._outcomes) == self._outcomes.maxlen and error_rate > self.max_error_rate)
+        ):
+            self._open()
+
+    def _open(self):
+        delay = min(self.base_delay * 2**self._opened, self.max_delay) * random.uniform(0.5, 1.0)
+        self._opened += 1
+        self.state = self.OPEN
+        self.open_until = time.monotonic() + delay
+        print(f"circuit opened for {delay:.0f} seconds")
@@ -0,0 +1,90 @@
+import re
+
+
+# a hotword of the hotword table: when one of its triggers (and one of the words it requires, if any) is in a
+# message, the bot responds to it, of the hotwords in the same group only the first one in the table responds
+class Hotword:
+    __slots__ = (
+        "name",
+        "triggers",
+        "requires",
+        "group",
+        "creator_only",
+        "action",
+        "responses",
+        "question_responses",
+        "denied",
+        "emoji",
+    )
+
+    def __init__(self, data: dict):
+        self.name: str = data["name"]
+        # the triggers are case sensitive, the required words are not
+        self.triggers: list[str] = data["triggers"]
+        self.requires: list[str] = data.get("requires", [])
+        self.group: str | None = data.get("group")
+        self.creator_only: bool = data.get("creator_only", False)
+        self.action: str | None = data.get("action")
+        self.responses: list[str] = data.get("responses", [])
+        # the responses to a message with a question mark (when different)
+        self.question_responses: list[str] = data.get("question_responses", self.responses)
+        # the responses to someone else than the creator, for a creator only hotword
+        self.denied: list[str] = data.get("denied", [])
+        self.emoji: bool = data.get("emoji", False)
+
+
+# finds the hotwords of a message by scanning it once for the triggers of all hotwords
+class HotwordEngine:
+    def __init__(self, table: dict):
+        self.creator: int | None = table.get("creator")
+        self.emojis: list[int] = table.get("emojis", [])
+        self.hotwords = [Hotword(data) for data in table["hotwords"]]
+
+        # every distinct word is a numbered group of a single pattern, as (text, ignore_case)
+        words = {(trigger, False) for hotword in self.hotwords for trigger in hotword.triggers}
+        words |= {(word, True) for hotword in self.hotwords for word in hotword.requires}
+        # longer words first, so of the words that start at the same position the longest one matches
+        self._words = sorted(words, key=lambda word: (-len(word[0]), word))
+        self._indexes = {word: i for i, word in enumerate(self._words)}
+        patterns = [self._word_pattern(text, ignore_case) for text, ignore_case in self._words]
+        alternation = "|".join(f"(?P<w{i}>{pattern})" for i, pattern in enumerate(patterns))
+        # the lookahead tries every position, so words that overlap are found as well
+        self._pattern = re.compile(f"(?=(?:{alternation}))")
+
+        # a word that matches also contains the words that match within it, which the scan can't report
+        # when they start at the same position, like "mahol" in "mahol, repeat:"
+        compiled = [re.compile(pattern) for pattern in patterns]
+        self._contains = [{j for j, other in enumerate(compiled) if other.search(text)} for text, _ in self._words]
+
+    @staticmethod
+    def _word_pattern(text: str, ignore_case: bool):
+        return f"(?i:{re.escape(text)})" if ignore_case else re.escape(text)
+
+    def find_words(self, content: str):
+        # returns the indexes of the words in content
+        found: set[int] = set()
+        for match in self._pattern.finditer(content):
+            i = int(match.lastgroup[1:])  # type:ignore
+            if i not in found:
+                found |= self._contains[i]
+        return found
+
+    def match(self, content: str):
+        # returns the hotwords that respond to content, in the order of the table
+        found = self.find_words(content)
+        if not found:
+            return []
+
+        hotwords = []
+        groups = set()
+        for hotword in self.hotwords:
+            if hotword.group in groups:
+                continue
+            if not any(self._indexes[(trigger, False)] in found for trigger in hotword.triggers):
+                continue
+            if hotword.requires and not any(self._indexes[(word, True)] in found for word in hotword.requires):
+                continue
+            hotwords.append(hotword)
+            if hotword.group:
+                groups.add(hotword.group)
+        return hotwords
@@ -0,0 +1,53 @@
+from functools import lru_cache
+import re
+
+
+# encodes text to morse and decodes it back, with configurable symbols for the dot and the dash
+# the letters are separated by three spaces, so a space between two words results in seven spaces
+class MorseEngine:
+    ENCODE_PREFIX = ">morse"
+    DECODE_PREFIX = ">unmorse"
+    LETTER_SEPARATOR = " " * 3
+    _ENCODE_PATTERN = re.compile(r">morse\s*(dot=(?P<dot>[^\s]))?\s*(dash=(?P<dash>[^\s]))?\s*(?P<morse>.*)")
+    _DECODE_PATTERN = re.compile(r">unmorse\s*(dot=(?P<dot>[^\s]))?\s*(dash=(?P<dash>[^\s]))?\s*(?P<morse>.*)")
+    # a word gap is longer than a letter gap
+    _WORD_GAP = re.compile(r"\s{5,}")
+
+    def __init__(self, morse_dict: dict[str, str]):
+        # the morse code of every (lowercase) letter, and the letter of every morse code
+        self._codes = {letter: code for letter, code in morse_dict.items() if code}
+        self._letters: dict[str, str] = {}
+        for letter, code in self._codes.items():
+            self._letters.setdefault(code, letter)
+        # the tables are built once per pair of symbols
+        self._encode_table = lru_cache(maxsize=64)(self._build_encode_table)
+        self._decode_table = lru_cache(maxsize=64)(self._build_decode_table)
+
+    def parse(self, content: str):
+        # returns (decode, text, dot, dash) when content is a morse command, or None when it isn't
+        if not content.startswith((self.ENCODE_PREFIX, self.DECODE_PREFIX)):
+            return None
+        decode = content.startswith(self.DECODE_PREFIX)
+        match = (self._DECODE_PATTERN if decode else self._ENCODE_PATTERN).match(content)
+        if not match:
+            return None
+        return (decode, match["morse"], match["dot"] or ".", match["dash"] or "-")
+
+    def encode(self, text: str, dot=".", dash="-"):
+        # letters without a morse code are kept as they are
+        table = self._encode_table(dot, dash)
+        return self.LETTER_SEPARATOR.join([table.get(letter.lower(), letter) for letter in text]).strip()
+
+    def decode(self, morse: str, dot=".", dash="-"):
+        # morse codes without a letter are kept as they are
+        letters = self._decode_table(dot, dash)
+        words = self._WORD_GAP.split(morse.strip())
+        return " ".join(["".join([letters.get(code, code) for code in word.split()]) for word in words])
+
+    def _build_encode_table(self, dot: str, dash: str):
+        symbols = str.maketrans({".": dot, "-": dash})
+        return {letter: code.translate(symbols) for letter, code in self._codes.items()}
+
+    def _build_decode_table(self, dot: str, dash: str):
+        symbols = str.maketrans({".": dot, "-": dash})
+        return {code.translate(symbols): letter for code, letter in self._letters.items()}
@@ -0,0 +1,71 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+import time
+
+
+# caches the world boss data for ttl seconds, after that the cached data is still served (for at most
+# max_stale seconds) while it is refreshed in the background, concurrent refreshes share a single fetch
+class WorldBossCache:
+    def __init__(self, fetch: Callable[[], Awaitable[list[dict]]], ttl: float = 300.0, max_stale: float = 3600.0):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.data: list[dict] | None = None
+        # monotonic time of the last successful fetch
+        self.fetched_at = 0.0
+        self._refresh_task: asyncio.Task | None = None
+        self._listeners: list[Callable[[], None]] = []
+        self.fetches = 0
+        self.hits = 0
+
+    def add_listener(self, listener: Callable[[], None]):
+        # listener is called every time the data is refreshed
+        self._listeners.append(listener)
+
+    @property
+    def age(self):
+        return time.monotonic() - self.fetched_at if self.data is not None else float("inf")
+
+    async def get(self):
+        age = self.age
+        if age < self.ttl:
+            self.hits += 1
+            return self.data
+        if age < self.ttl + self.max_stale:
+            # serve the stale data right away and refresh it in the background
+            self.hits += 1
+            self._start_refresh()
+            return self.data
+        try:
+            return await self.refresh()
+        except Exception:
+            if self.data is None:
+                raise
+            # the last good data is better than nothing, its age tells how stale it is
+            return self.data
+
+    async def refresh(self):
+        # shield the shared fetch, so a cancelled caller doesn't cancel it for the others
+        return await asyncio.shield(self._start_refresh())
+
+    def _start_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._do_refresh())
+            self._refresh_task.add_done_callback(self._on_refresh_done)
+        return self._refresh_task
+
+    async def _do_refresh(self):
+        self.fetches += 1
+        data = await self._fetch()
+        self.data = data
+        self.fetched_at = time.monotonic()
+        for listener in self._listeners:
+            listener()
+        return data
+
+    @staticmethod
+    def _on_refresh_done(task: asyncio.Task):
+        # retrieve the exception of a background refresh that nobody awaited
+        if not task.cancelled() and task.exception():
+            print(f"failed to refresh the world boss data: {task.exception()}")
@@ -0,0 +1,68 @@
+import json
+
+import aiohttp
+
+
+class WorldBossError(Exception):
+    pass
+
+
+# non-blocking client for the SMMO world boss API, keeps the connection alive between requests
+class WorldBossClient:
+    def __init__(
+        self,
+        url: str,
+        api_key: str,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        total_timeout: float = 15.0,
+        max_size: int = 1 << 20,
+        keepalive_timeout: float = 60.0,
+    ):
+        self._url = f"{url}?api_key={api_key}"
+        self._timeout = aiohttp.ClientTimeout(
+            total=total_timeout, sock_connect=connect_timeout, sock_read=read_timeout
+        )
+        # the maximum size of a response body in bytes
+        self._max_size = max_size
+        self._keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    def _get_session(self):
+        # the session must be created from within the running event loop
+        if not self._session or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=4, keepalive_timeout=self._keepalive_timeout)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+        return self._session
+
+    async def fetch(self) -> list[dict]:
+        # returns the world bosses sorted on enable_time, without the test bosses
+        # raises WorldBossError when the API doesn't return a valid list of world bosses,
+        # and asyncio.TimeoutError or aiohttp.ClientError when the request fails
+        session = self._get_session()
+        async with session.post(self._url) as response:
+            if response.status != 200:
+                raise WorldBossError(f"world boss API returned status {response.status}")
+            if response.content_length and response.content_length > self._max_size:
+                raise WorldBossError(f"world boss API response is too large ({response.content_length} bytes)")
+            # read the whole body in chunks, a chunked response has no content length to check up front
+            body = bytearray()
+            async for chunk in response.content.iter_chunked(1 << 16):
+                body += chunk
+                if len(body) > self._max_size:
+                    raise WorldBossError("world boss API response is too large")
+
+        try:
+            entries = json.loads(body)
+        except ValueError:
+            raise WorldBossError("world boss API returned invalid JSON")
+        if not isinstance(entries, list):
+            raise WorldBossError("world boss API didn't return a list")
+
+        # remove test bosses that have name 'Test' and sort on enable_time in one go
+        return sorted((entry for entry in entries if entry["name"] != "Test"), key=lambda entry: entry["enable_time"])
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
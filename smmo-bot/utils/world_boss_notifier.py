@@ -0,0 +1,74 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+import time
+
+from .world_boss_cache import WorldBossCache
+
+
+# sleeps until the next world boss notification is due, instead of polling for it
+# plan(data) returns the unix timestamp of the next notification (or None when there is nothing to notify),
+# and fire(data) is called once that time has come, after which the next notification is planned
+# the plan is made again when the data is refreshed, or when replan() is called after a setting changed
+class WorldBossNotifier:
+    def __init__(
+        self,
+        cache: WorldBossCache,
+        plan: Callable[[list[dict]], float | None],
+        fire: Callable[[list[dict]], Awaitable[None]],
+        retry_delay: float = 30.0,
+    ):
+        self._cache = cache
+        self._plan = plan
+        self._fire = fire
+        self._retry_delay = retry_delay
+        self._replan = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.wakeups = 0
+        cache.add_listener(self.replan)
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def replan(self):
+        self._replan.set()
+
+    async def _run(self):
+        while True:
+            self._replan.clear()
+            self.wakeups += 1
+            try:
+                data = await self._cache.get()
+            except Exception as e:
+                print(str(e))  # print the exception for debugging purposes
+                await self._sleep(self._retry_delay)
+                continue
+
+            notify_at = self._plan(data)
+            if notify_at is not None and notify_at <= time.time():
+                try:
+                    await self._fire(data)
+                except Exception as e:
+                    print(str(e))  # print the exception for debugging purposes
+                    await self._sleep(self._retry_delay)
+                continue
+
+            # wake up when the cached data expires as well, so a changed schedule is picked up
+            # (when it already expired, it is being refreshed and the refresh makes a new plan)
+            expires_in = self._cache.ttl - self._cache.age
+            delay = expires_in if expires_in > 0 else self._retry_delay
+            if notify_at is not None:
+                delay = min(delay, notify_at - time.time())
+            await self._sleep(delay)
+
+    async def _sleep(self, delay: float):
+        # sleep for delay seconds, or until a new plan is needed
+        try:
+            await asyncio.wait_for(self._replan.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,52 @@
+from discord import Client
+from discord.abc import Messageable
+
+
+# the world boss notifications of a guild: the channel they are sent to, how many seconds before a world boss
+# is attackable they are sent, and the enable_time of the last world boss that was notified
+class WorldBossSubscription:
+    __slots__ = ("guild_id", "channel_id", "notify_before_sec", "last_notified_boss", "_channel")
+
+    def __init__(self, guild_id: int, channel_id: int, notify_before_sec: int = 0, last_notified_boss: int = 0):
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.notify_before_sec = notify_before_sec
+        self.last_notified_boss = last_notified_boss
+        # the channel object is resolved on first use
+        self._channel: Messageable | None = None
+
+    @classmethod
+    def from_dict(cls, guild_id: int, data: dict):
+        return cls(guild_id, data["channel"], data.get("notify_before_sec", 0), data.get("last_notified_boss", 0))
+
+    def to_dict(self):
+        return {
+            "channel": self.channel_id,
+            "notify_before_sec": self.notify_before_sec,
+            "last_notified_boss": self.last_notified_boss,
+        }
+
+    def next_wb(self, data: list[dict]):
+        # return the first wb that has enable_time larger than last notified (data is sorted on enable_time)
+        for wb in data:
+            if wb["enable_time"] > self.last_notified_boss:
+                return wb
+        return None
+
+    def notify_time(self, data: list[dict]):
+        # the time at which the next wb must be notified, or None when there is no wb to notify
+        next_wb = self.next_wb(data)
+        if not next_wb:
+            return None
+        return next_wb["enable_time"] - self.notify_before_sec
+
+    def channel(self, client: Client):
+        if self._channel is None:
+            channel = client.get_channel(self.channel_id)
+            if isinstance(channel, Messageable):
+                self._channel = channel
+        return self._channel
+
+    def forget_channel(self):
+        # drop the resolved channel, so it is resolved again on next use
+        self._channel = None
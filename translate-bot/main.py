@@ -1,27 +1,47 @@
+import asyncio
 from datetime import datetime
-import io
+from datetime import timedelta
 import json
 import os
-import random
 import re
 from re import Match
-import requests
-import shutil
+import signal
 import time
 from urllib.parse import urlencode
 from urllib.parse import quote
 
+import aiohttp
 import discord
 from discord import Member
 from discord import Message
 from discord.channel import TextChannel
-from discord.ext import tasks
 from discord.ext.commands import Bot
 
+from utils import CommandRouter
+from utils import DeadlineScheduler
+from utils import FanOut
+from utils import HttpClient
 from utils import Settings
+from utils import SqliteSettingsStore
+from utils import TranslationCache
+from utils.wotd import forget_wordlist
+from utils.wotd import load_wordlist
+from utils.wotd import new_seed
+from utils.wotd import shuffled_index
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
 assert DISCORD_TOKEN, f"FATAL: discord token 'DISCORD_TOKEN' not found in env!"
+# store the settings as json files (json, default) or in a single database (sqlite)
+SETTINGS_BACKEND = os.getenv("SETTINGS_BACKEND", "json")
+# the wotds of all guilds at the day boundary are spread over this many seconds
+WOTD_FANOUT_WINDOW = float(os.getenv("WOTD_FANOUT_WINDOW", "60"))
+# the maximum number of guilds that are sending their wotd at the same time
+WOTD_FANOUT_CONCURRENCY = int(os.getenv("WOTD_FANOUT_CONCURRENCY", "4"))
+# the words (and translations) of the next day are prefetched this many seconds before the day boundary
+WOTD_PREFETCH_LEAD = float(os.getenv("WOTD_PREFETCH_LEAD", "600"))
+
+if SETTINGS_BACKEND == "sqlite":
+    Settings.store = SqliteSettingsStore("data/settings.sqlite3")
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -30,8 +50,24 @@ intents.members = True
 # set the command prefix and the bot's status
 command_prefix = "/"
 activity = discord.Activity(type=discord.ActivityType.watching, name=f"'get-command-prefix'")
+
+
+class TranslateBot(Bot):
+    async def setup_hook(self):
+        # docker stops the bot with SIGTERM, close the bot on it so bot.run returns and the settings are flushed at exit
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass  # signal handlers are not supported on this platform
+
+    async def close(self):
+        # bot.run closes the bot on exit, close the http session with it so its connections aren't leaked
+        await super().close()
+        await _http_client.close()
+
+
 # create the bot
-bot = Bot(command_prefix=command_prefix, activity=activity, intents=intents)
+bot = TranslateBot(command_prefix=command_prefix, activity=activity, intents=intents)
 
 
 COLOR_INFO = 0x3232FE
@@ -44,6 +80,11 @@ _cc_mapping: dict[str, str] = {}
 _common_lang: list[str] = []
 _commands: list[dict] = []
 _admin_commands: list[dict] = []
+_router = CommandRouter([], [])
+_http_client = HttpClient()
+_translation_cache = TranslationCache(db_path="data/translation_cache.sqlite3")
+_wotd_fanout = FanOut(WOTD_FANOUT_WINDOW, WOTD_FANOUT_CONCURRENCY)
+_wotd_prefetched_day = None
 
 
 @bot.event
@@ -54,6 +95,7 @@ async def on_ready():
     global _common_lang
     global _commands
     global _admin_commands
+    global _router
 
     with open("language_data.json") as f:
         language_data = json.load(f)
@@ -153,10 +195,23 @@ async def on_ready():
             "regex": r"wotd-channel(?P<channel>.*)$",
             "function": _admin_command_wotd_channel,
         },
+        {
+            "name": "Cache stats",
+            "description": "Show the hit rate of the caches of the bot",
+            "usage": "cache-stats",
+            "regex": r"cache-stats$",
+            "function": _admin_command_cache_stats,
+        },
     ]
 
-    # start the background task
-    await background_task_wotd.start()
+    _router = CommandRouter(_commands, _admin_commands)
+
+    # schedule the wotd of all known guilds and start the wotd scheduler
+    for guild_id in Settings.load_settings_file().get("guilds", []):
+        _wotd_scheduler.reschedule(guild_id)
+    _wotd_scheduler.start()
+    _wotd_prefetch_scheduler.reschedule("prefetch")
+    _wotd_prefetch_scheduler.start()
 
 
 @bot.event
@@ -197,34 +252,15 @@ async def on_message(message: Message):
         await _handle_command_prefix(message, prefix, "/", guild_id)
         return
 
-    # process all commands
-    for command in _commands:
-        regex = r"^" + _escape_re(prefix) + command["regex"]
-        match = re.match(regex, message.content)
-        if match:
-            # print("match command")
-            await command["function"](message, match, message.author.guild.id)
-            if delete_bot_commands:
-                await message.delete()
+    # process all (admin) commands
+    route = _router.route(prefix, message.content)
+    if route:
+        command, is_admin, match = route
+        if is_admin and not await _ensure_authorized(message):
             return
-
-    # process all admin commands
-    for command in _admin_commands:
-        regex = r"^" + _escape_re(prefix) + command["regex"]
-        match = re.match(regex, message.content)
-        if match:
-            # print("match admin command")
-            if not await _ensure_authorized(message):
-                return
-            await command["function"](message, match, message.author.guild.id)
-            if delete_bot_commands:
-                await message.delete()
-            return
-
-
-def _escape_re(expression):
-    # make sure to also escape / in the string
-    return re.escape(expression)  # .replace("/", "\\/")
+        await command["function"](message, match, message.author.guild.id)
+        if delete_bot_commands:
+            await message.delete()
 
 
 async def _ensure_authorized(message: Message):
@@ -294,45 +330,13 @@ async def _command_translate_from_to(message: Message, match: Match, guild_id: i
 
 
 async def _translate(message: Message, src, dst, text):
-    # generate the url for the translate API call
-    url = "https://translate.googleapis.com/translate_a/single?"
-    params = {"client": "gtx", "sl": src, "tl": dst, "dt": "t", "q": text}
-    encoded = urlencode(params, quote_via=quote)
-    url += encoded
-
-    # send the request
-    response = requests.get(url)
-
-    # parse the result
-    # verify status code is correct
-    if response.status_code != 200:
-        await _send_error(message, f"translate API status code: {response.status_code}!")
-        return
-    response_headers = response.headers.get("content-type")
-    if not response_headers:
-        await _send_error(message, f"translate API returns wrong content-type!")
-        return
-    # verify application content is JSON
-    if "application/json" not in response_headers:
-        await _send_error(message, f"translate API doesn't return JSON data!")
-        return
-    # verify that we can access response.json()[0][0][0] (the translation)
-    try:
-        if text != "":
-            response.json()[0][0][0]
-    except:
-        await _send_error(message, f"translation result is not available!")
+    translation, error = await _get_translation(src, dst, text)
+    if translation is None:
+        await _send_error(message, error)
         return
 
     # show the actual translation
-    translation = ""
-    for sentence in response.json()[0]:
-        translation += sentence[0]
-    link = (
-        f"[Click here to listen on google translate]"
-        f"(https://translate.google.com/?op=translate&"
-        f"sl={src}&tl={dst}&text={quote(text)})"
-    )
+    link = _translate_link(src, dst, text)
 
     # map the src/dst language to the actual language names (if available)
     src = _lang_lut.get(src) or src
@@ -349,6 +353,53 @@ async def _translate(message: Message, src, dst, text):
     await message.channel.send(embed=embed)
 
 
+def _translate_link(src, dst, text):
+    return (
+        f"[Click here to listen on google translate]"
+        f"(https://translate.google.com/?op=translate&"
+        f"sl={src}&tl={dst}&text={quote(text)})"
+    )
+
+
+async def _get_translation(src, dst, text):
+    # returns (translation, error), the translation is None when it failed
+    translation = _translation_cache.get(src, dst, text)
+    if translation is not None:
+        return (translation, "")
+
+    # generate the url for the translate API call
+    url = "https://translate.googleapis.com/translate_a/single?"
+    params = {"client": "gtx", "sl": src, "tl": dst, "dt": "t", "q": text}
+    encoded = urlencode(params, quote_via=quote)
+    url += encoded
+
+    # send the request
+    try:
+        status, content_type, data = await _http_client.get_json(url)
+    except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+        return (None, f"translate API request failed: {type(e).__name__}!")
+
+    # parse the result
+    # verify status code is correct
+    if status != 200:
+        return (None, f"translate API status code: {status}!")
+    if not content_type:
+        return (None, f"translate API returns wrong content-type!")
+    # verify application content is JSON
+    if "application/json" not in content_type:
+        return (None, f"translate API doesn't return JSON data!")
+    # verify that we can access data[0][0][0] (the translation)
+    try:
+        if text != "":
+            data[0][0][0]  # type:ignore
+    except:
+        return (None, f"translation result is not available!")
+
+    translation = "".join(sentence[0] for sentence in data[0])  # type:ignore
+    _translation_cache.put(src, dst, text, translation)
+    return (translation, "")
+
+
 async def _command_wotd(message: Message, match: Match, guild_id: int):
     channel: TextChannel = message.channel  # type:ignore
     await _generate_wotd(guild_id, force=True, msg_channel=channel)
@@ -360,17 +411,15 @@ async def _command_wotd_words_left(message: Message, match: Match, guild_id: int
         # no wotd channel or languageconfigured, return
         return
 
-    file_extension = Settings.get(guild_id, "wotd_type")
-    filename = f"guild_data/{guild_id}-wotd.{file_extension}"
-    # count the lines in the file
-    with io.open(filename, encoding="utf-8") as f:
-        lines = f.readlines()
-        embed = discord.Embed(
-            title=f"WOTD words left",
-            color=COLOR_INFO,
-            description=f"{len(lines)}",
-        )
-        await message.channel.send(embed=embed)
+    # the words that are not drawn yet from the shuffled list
+    words = load_wordlist(_wotd_filename(guild_id))
+    cursor = int(Settings.get(guild_id, "wotd_cursor", 0))
+    embed = discord.Embed(
+        title=f"WOTD words left",
+        color=COLOR_INFO,
+        description=f"{max(0, len(words) - cursor)}",
+    )
+    await message.channel.send(embed=embed)
 
 
 async def _command_languages(message: Message, match: Match, guild_id: int):
@@ -416,6 +465,33 @@ async def _admin_command_command_prefix(message: Message, match: Match, guild_id
     await _handle_command_prefix(message, prefix, new_prefix, guild_id)
 
 
+async def _admin_command_cache_stats(message: Message, match: Match, guild_id: int):
+    settings_stats = Settings.cache_stats()
+    lookups = settings_stats["hits"] + settings_stats["misses"]
+    hit_rate = settings_stats["hits"] / lookups if lookups else 0.0
+    embed = discord.Embed(title="Cache stats", color=COLOR_ADMIN)
+    embed.add_field(
+        name="Settings",
+        value=f'Hits: {settings_stats["hits"]}\n'
+        f'Misses: {settings_stats["misses"]}\n'
+        f"Hit rate: {hit_rate:.1%}\n"
+        f'Cached files: {settings_stats["cached"]}\n'
+        f'Unwritten files: {settings_stats["dirty"]}',
+        inline=False,
+    )
+    translation_stats = _translation_cache.stats()
+    embed.add_field(
+        name="Translations",
+        value=f'Hits: {translation_stats["hits"]}\n'
+        f'Disk hits: {translation_stats["disk_hits"]}\n'
+        f'Misses: {translation_stats["misses"]}\n'
+        f'Hit rate: {translation_stats["hit_rate"]:.1%}\n'
+        f'Cached entries: {translation_stats["entries"]}',
+        inline=False,
+    )
+    await message.channel.send(embed=embed)
+
+
 async def _admin_command_server_language(message: Message, match: Match, guild_id: int):
     language = str(Settings.get(guild_id, "server_language", ""))
     language = _map_cc(language)
@@ -455,6 +531,7 @@ async def _admin_command_wotd_language(message: Message, match: Match, guild_id:
         if new_wotd_language == "clear":
             # clear the wotd language from the settings file
             Settings.delete(guild_id, "wotd_language")
+            Settings.delete(guild_id, "wotd_list")
             embed = discord.Embed(
                 title=f"WOTD language",
                 description=f"WOTD language is cleared!",
@@ -462,12 +539,7 @@ async def _admin_command_wotd_language(message: Message, match: Match, guild_id:
             )
             await message.channel.send(embed=embed)
             # remove the wotd file if available
-            filename = f"guild_data/{guild_id}-wotd.txt"
-            if os.path.isfile(filename):
-                os.remove(filename)
-            filename = f"guild_data/{guild_id}-wotd.tsv"
-            if os.path.isfile(filename):
-                os.remove(filename)
+            _remove_wotd_files(guild_id)
             return
         if is_tsv:
             if _lang_lut.get(new_wotd_language_from):
@@ -483,21 +555,15 @@ async def _admin_command_wotd_language(message: Message, match: Match, guild_id:
                     return
                 src_filename = f"wotd_data/wotd-list-" f"{new_wotd_language_from}-{new_wotd_language_to}.tsv"
                 if os.path.isfile(src_filename):
-                    # remove the (previous) wotd file if available
-                    filename = f"guild_data/{guild_id}-wotd.txt"
-                    if os.path.isfile(filename):
-                        os.remove(filename)
-                    filename = f"guild_data/{guild_id}-wotd.tsv"
-                    if os.path.isfile(filename):
-                        os.remove(filename)
+                    # remove the (previous, per-guild) wotd file if available
+                    _remove_wotd_files(guild_id)
                     # handle languages which do have a wotd list
-                    # copy the wotd language file
-                    dst_filename = f"guild_data/{guild_id}-wotd.tsv"
-                    shutil.copyfile(src_filename, dst_filename)
-                    # update the settings file with the wotd language
+                    # update the settings file with the (shared) wotd list and language
+                    Settings.set(guild_id, "wotd_list", src_filename)
                     Settings.set(guild_id, "wotd_language", new_wotd_language_from)
                     Settings.set(guild_id, "wotd_to_language", new_wotd_language_to)
                     Settings.set(guild_id, "wotd_type", "tsv")
+                    _reset_wotd_order(guild_id)
                     # send embed with the result
                     embed = discord.Embed(
                         title=f"WOTD language",
@@ -532,20 +598,14 @@ async def _admin_command_wotd_language(message: Message, match: Match, guild_id:
                     return
                 src_filename = f"wotd_data/wotd-list-{new_wotd_language}.txt"
                 if os.path.isfile(src_filename):
-                    # remove the (previous) wotd file if available
-                    filename = f"guild_data/{guild_id}-wotd.txt"
-                    if os.path.isfile(filename):
-                        os.remove(filename)
-                    filename = f"guild_data/{guild_id}-wotd.tsv"
-                    if os.path.isfile(filename):
-                        os.remove(filename)
+                    # remove the (previous, per-guild) wotd file if available
+                    _remove_wotd_files(guild_id)
                     # handle languages which do have a wotd list
-                    # copy the wotd language file
-                    dst_filename = f"guild_data/{guild_id}-wotd.txt"
-                    shutil.copyfile(src_filename, dst_filename)
-                    # update the settings file with the wotd language
+                    # update the settings file with the (shared) wotd list and language
+                    Settings.set(guild_id, "wotd_list", src_filename)
                     Settings.set(guild_id, "wotd_language", new_wotd_language)
                     Settings.set(guild_id, "wotd_type", "txt")
+                    _reset_wotd_order(guild_id)
                     # send embed with the result
                     embed = discord.Embed(
                         title=f"WOTD language",
@@ -750,22 +810,69 @@ async def _send_language_embed(message: Message, title: str, cc_list: list[str])
         await message.channel.send(embed=embed)
 
 
-async def _get_wotd_from_file(guild_id: int):
+def _wotd_filename(guild_id: int):
+    # the wotd lists are shared by the guilds, guilds configured before that are moved to the shared list
+    if not Settings.get(guild_id, "wotd_list"):
+        _migrate_wotd_list(guild_id)
+    if Settings.get(guild_id, "wotd_list"):
+        return str(Settings.get(guild_id, "wotd_list"))
+    # the shared list of the guild doesn't exist anymore, keep using its own copy
     file_extension = Settings.get(guild_id, "wotd_type")
-    filename = f"guild_data/{guild_id}-wotd.{file_extension}"
-    # generate word and remove from the current wordlist
-    with io.open(filename, encoding="utf-8") as f:
-        lines = f.readlines()
-        if not lines:
-            print(f"wotd list empty for guild: {guild_id}")
-            return (False, "")
-        wotd = random.choice(lines)
-        lines.remove(wotd)
-
-    # save the wordlist with the word removed
-    with io.open(filename, "w", encoding="utf-8") as f:
-        f.writelines(lines)
+    return f"guild_data/{guild_id}-wotd.{file_extension}"
+
 
+def _migrate_wotd_list(guild_id: int):
+    # switch a guild from its own copy of the wotd list to the shared list, and remove the copy
+    language = Settings.get(guild_id, "wotd_language")
+    if Settings.get(guild_id, "wotd_type") == "tsv":
+        src_filename = f"wotd_data/wotd-list-{language}-{Settings.get(guild_id, 'wotd_to_language')}.tsv"
+    else:
+        src_filename = f"wotd_data/wotd-list-{language}.txt"
+    if not language or not os.path.isfile(src_filename):
+        return
+    _remove_wotd_files(guild_id)
+    Settings.set(guild_id, "wotd_list", src_filename)
+    # the words drawn from the copy can't be mapped to the shared list, start a new shuffled order
+    _reset_wotd_order(guild_id)
+
+
+def _remove_wotd_files(guild_id: int):
+    # remove the (per-guild copy of the) wotd file if available
+    for file_extension in ["txt", "tsv"]:
+        filename = f"guild_data/{guild_id}-wotd.{file_extension}"
+        forget_wordlist(filename, remove_compiled=True)
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def _reset_wotd_order(guild_id: int):
+    # start drawing the words of the wotd list in a new shuffled order
+    Settings.set(guild_id, "wotd_seed", new_seed())
+    Settings.set(guild_id, "wotd_cursor", 0)
+
+
+def _peek_wotd(guild_id: int):
+    # returns the next wotd without drawing it, or None when the wotd list is empty
+    # the wordlist is never modified, the words are drawn in a seeded shuffled order,
+    # where the cursor is the number of words drawn so far (the first cursor words of the order are used)
+    words = load_wordlist(_wotd_filename(guild_id))
+    if Settings.get(guild_id, "wotd_seed") is None:
+        # wotd list configured before the shuffled order, shuffle the words that are left in it
+        _reset_wotd_order(guild_id)
+    seed = int(Settings.get(guild_id, "wotd_seed"))
+    cursor = int(Settings.get(guild_id, "wotd_cursor", 0))
+    if cursor >= len(words):
+        return None
+    return words[shuffled_index(cursor, len(words), seed)]
+
+
+async def _get_wotd_from_file(guild_id: int):
+    wotd = _peek_wotd(guild_id)
+    if wotd is None:
+        print(f"wotd list empty for guild: {guild_id}")
+        return (False, "")
+
+    Settings.set(guild_id, "wotd_cursor", int(Settings.get(guild_id, "wotd_cursor", 0)) + 1)
     return (True, wotd)
 
 
@@ -860,29 +967,87 @@ async def _generate_wotd(guild_id: int, force=False, msg_channel: TextChannel |
         )
         await channel.send(embed=embed)
     else:
-        embed = discord.Embed(
-            title=f"{language} word of the day {today}",
-            description=f"{wotd}",
-            color=COLOR_INFO,
+        # translate the wotd and send it together with the translation
+        src = _map_cc(cc)
+        dst = _map_cc("en")
+        translation, error = await _get_translation(src, dst, wotd)
+        if translation is None:
+            print(f"wotd translation failed for guild: {guild_id}: {error}")
+            translation = "*translation not available*"
+        to_language = _lang_lut.get(dst) or dst
+        embed = (
+            discord.Embed(
+                title=f"{language} word of the day {today}",
+                color=COLOR_INFO,
+            )
+            .add_field(name=f"{language}", value=f"{wotd}", inline=False)
+            .add_field(name=f"{to_language}", value=f"{translation}", inline=False)
+            .add_field(name=f"Link", value=f"{_translate_link(src, dst, wotd)}", inline=False)
         )
         await channel.send(embed=embed)
 
-        # send the translate command to translate the wotd
-        command = f"{Settings.get(guild_id, 'command_prefix')}{cc}2en {wotd}"
-        await channel.send(command)
 
+def _wotd_configured(guild_id: int):
+    return bool(Settings.get(guild_id, "wotd_channel") and Settings.get(guild_id, "wotd_language"))
 
-@tasks.loop(seconds=10.0)
-async def background_task_wotd():
-    if not bot.is_ready():
-        return
 
-    try:
-        settings = Settings.load_settings_file()
-        for guild_id in settings.get("guilds", []):
-            await _generate_wotd(guild_id)
-    except Exception as e:
-        print(str(e))  # print the exception for debugging purposes
+def _next_wotd_time(guild_id: int):
+    # the wotd is due right away when it is not shown today, and otherwise at the start of the next day
+    # returns None if the guild doesn't have wotd configured
+    if not _wotd_configured(guild_id):
+        return None
+    now = datetime.fromtimestamp(time.time())
+    if str(now.date()) != Settings.get(guild_id, "wotd_date"):
+        return now.timestamp()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return tomorrow.timestamp()
+
+
+async def _generate_due_wotds(guild_ids: list[int]):
+    duration = await _wotd_fanout.run(guild_ids, _generate_wotd)  # type:ignore
+    print(f"wotd fan-out for {len(guild_ids)} guild(s) took {duration:.1f} seconds")
+
+
+def _next_wotd_prefetch_time(key: str):
+    # prefetch the wotds shortly before the next day boundary that isn't prefetched yet
+    now = datetime.fromtimestamp(time.time())
+    boundary = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    if boundary.date() == _wotd_prefetched_day:
+        boundary += timedelta(days=1)
+    return boundary.timestamp() - WOTD_PREFETCH_LEAD
+
+
+async def _prefetch_wotds(keys: list[str]):
+    # peek at the next wotd of every guild, and translate it ahead of time so it is cached at the boundary
+    global _wotd_prefetched_day
+
+    # this runs in the lead time before the boundary, so the day after today is the day that is prefetched
+    _wotd_prefetched_day = datetime.fromtimestamp(time.time()).date() + timedelta(days=1)
+    guild_ids = [
+        guild_id
+        for guild_id in Settings.load_settings_file().get("guilds", [])
+        if _wotd_configured(guild_id) and Settings.get(guild_id, "wotd_type") == "txt"
+    ]
+
+    async def prefetch(guild_id: int):
+        wotd = _peek_wotd(guild_id)
+        if wotd:
+            cc = str(Settings.get(guild_id, "wotd_language"))
+            await _get_translation(_map_cc(cc), _map_cc("en"), wotd.strip())
+
+    duration = await _wotd_fanout.run(guild_ids, prefetch, window=0.0)  # type:ignore
+    print(f"wotd prefetch for {len(guild_ids)} guild(s) took {duration:.1f} seconds")
+
+
+def _on_setting_changed(guild_id: int, setting: str):
+    # only the settings used by _next_wotd_time change when the next wotd is due
+    if setting in ["wotd_channel", "wotd_language", "wotd_date"]:
+        _wotd_scheduler.reschedule(guild_id)
+
+
+_wotd_scheduler = DeadlineScheduler(_next_wotd_time, _generate_due_wotds)  # type:ignore
+_wotd_prefetch_scheduler = DeadlineScheduler(_next_wotd_prefetch_time, _prefetch_wotds)  # type:ignore
+Settings.add_listener(_on_setting_changed)
 
 
 bot.run(DISCORD_TOKEN)
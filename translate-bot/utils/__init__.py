@@ -1,3 +1,19 @@
+from .command_router import CommandRouter
+from .fanout import FanOut
+from .http_client import HttpClient
+from .scheduler import DeadlineScheduler
 from .settings import Settings
+from .settings_store import JsonSettingsStore
+from .settings_store import SqliteSettingsStore
+from .translation_cache import TranslationCache
 
-__all__ = ["Settings"]
+__all__ = [
+    "CommandRouter",
+    "DeadlineScheduler",
+    "FanOut",
+    "HttpClient",
+    "JsonSettingsStore",
+    "Settings",
+    "SqliteSettingsStore",
+    "TranslationCache",
+]
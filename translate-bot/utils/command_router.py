@@ -0,0 +1,43 @@
+import re
+from re import Match
+from re import Pattern
+
+# matches the start of a named group, used to strip the names in the combined pattern
+_named_group = re.compile(r"\(\?P<[^>]+>")
+
+
+# matches messages against all commands with a single regex, instead of one regex per command
+# the command regexes are matched directly after the prefix, so the compiled patterns are independent
+# of the prefix and are shared by all guilds
+class CommandRouter:
+    def __init__(self, commands: list[dict], admin_commands: list[dict]):
+        # keep the order of the commands, the first matching command wins
+        self._routes = [(command, False) for command in commands]
+        self._routes += [(command, True) for command in admin_commands]
+        self._patterns: list[Pattern] = [re.compile(command["regex"]) for command, _ in self._routes]
+
+        # the named groups are removed from the combined pattern, since the commands reuse the same
+        # group names, and the group of every alternative is used to find the matching command
+        alternatives = [
+            f"(?P<c{index}>{_named_group.sub('(?:', command['regex'])})"
+            for index, (command, _) in enumerate(self._routes)
+        ]
+        self._combined: Pattern = re.compile("|".join(alternatives) or r"(?!)")
+
+    def route(self, prefix: str, content: str) -> tuple[dict, bool, Match] | None:
+        # cheap rejection of the normal (non-command) messages
+        if not content.startswith(prefix):
+            return None
+
+        pos = len(prefix)
+        combined_match = self._combined.match(content, pos)
+        if not combined_match or not combined_match.lastgroup:
+            return None
+
+        # rematch with the matching command's own pattern, so the command gets its named groups
+        index = int(combined_match.lastgroup[1:])
+        command, is_admin = self._routes[index]
+        match = self._patterns[index].match(content, pos)
+        if not match:
+            return None
+        return (command, is_admin, match)
@@ -0,0 +1,35 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Hashable
+import random
+import time
+
+
+# runs a function for many keys at once, spread over a time window and with a bounded concurrency,
+# so a burst (like every guild posting its wotd at the day boundary) doesn't hit the rate limits at once
+class FanOut:
+    def __init__(self, window: float = 60.0, concurrency: int = 4):
+        self.window = window
+        self.concurrency = concurrency
+        self.last_duration = 0.0
+
+    async def run(self, keys: list[Hashable], func: Callable[[Hashable], Awaitable[None]], window=None):
+        # returns the number of seconds it took to run func for all keys
+        window = self.window if window is None else window
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start = time.monotonic()
+
+        async def run_one(key: Hashable, delay: float):
+            await asyncio.sleep(delay)
+            async with semaphore:
+                try:
+                    await func(key)
+                except Exception as e:
+                    print(str(e))  # print the exception for debugging purposes
+
+        # a single key is not part of a burst, so it doesn't need to be delayed
+        window = window if len(keys) > 1 else 0.0
+        await asyncio.gather(*[run_one(key, random.uniform(0.0, window)) for key in keys])
+        self.last_duration = time.monotonic() - start
+        return self.last_duration
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+import aiohttp
+from yarl import URL
+
+
+# shared non-blocking http client, keeps the connections alive between requests
+class HttpClient:
+    def __init__(
+        self,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 10.0,
+        max_in_flight: int = 8,
+        keepalive_timeout: float = 60.0,
+    ):
+        self._timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self._max_in_flight = max_in_flight
+        self._keepalive_timeout = keepalive_timeout
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def _get_session(self):
+        # the session must be created from within the running event loop
+        if not self._session or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._max_in_flight,
+                keepalive_timeout=self._keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return self._session
+
+    async def get_json(self, url: str):
+        # returns (status, content_type, data), data is the parsed JSON body or None when not available
+        # raises asyncio.TimeoutError or aiohttp.ClientError when the request fails
+        session = self._get_session()
+        assert self._semaphore
+        async with self._semaphore:
+            # the url is already encoded by the caller, don't let aiohttp requote it
+            async with session.get(URL(url, encoded=True)) as response:
+                content_type = response.headers.get("content-type", "")
+                data = None
+                if response.status == 200 and "application/json" in content_type:
+                    try:
+                        data = json.loads(await response.read())
+                    except ValueError:
+                        data = None
+                return (response.status, content_type, data)
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
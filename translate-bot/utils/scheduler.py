@@ -0,0 +1,95 @@
+import asyncio
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Hashable
+import heapq
+import itertools
+import time
+
+
+# sleeps until the earliest deadline of its keys, and then calls the callback with all keys that are due
+# due(key) returns the deadline (unix timestamp) of the key, or None when the key doesn't need to be scheduled
+class DeadlineScheduler:
+    def __init__(
+        self,
+        due: Callable[[Hashable], float | None],
+        callback: Callable[[list[Hashable]], Awaitable[None]],
+        retry_delay: float = 10.0,
+    ):
+        self._due = due
+        self._callback = callback
+        # minimum delay before a key is due again after the callback, so a failing key doesn't spin
+        self._retry_delay = retry_delay
+        # min-heap of (deadline, sequence, key), rescheduled keys leave a stale entry behind that is skipped
+        self._heap: list[tuple[float, int, Hashable]] = []
+        self._deadlines: dict[Hashable, float] = {}
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def reschedule(self, key: Hashable, not_before: float = 0.0):
+        deadline = self._due(key)
+        if deadline is None:
+            self._deadlines.pop(key, None)
+            return
+        deadline = max(deadline, not_before)
+        if self._deadlines.get(key) == deadline:
+            return
+
+        self._deadlines[key] = deadline
+        sequence = next(self._sequence)
+        heapq.heappush(self._heap, (deadline, sequence, key))
+        if self._heap[0][1] == sequence:
+            # the new deadline is the earliest one, wake up the scheduler to sleep until that one
+            self._wakeup.set()
+
+    def next_deadline(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def _drop_stale(self):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                await self._wakeup.wait()
+                continue
+            delay = deadline - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # collect all keys that are due
+            keys = []
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self._heap)
+                if self._deadlines.get(key) == deadline:
+                    del self._deadlines[key]
+                    keys.append(key)
+
+            try:
+                await self._callback(keys)
+            except Exception as e:
+                print(str(e))  # print the exception for debugging purposes
+
+            # schedule the next deadline of keys that weren't rescheduled by the callback
+            not_before = time.time() + self._retry_delay
+            for key in keys:
+                if key not in self._deadlines:
+                    self.reschedule(key, not_before)
@@ -1,5 +1,9 @@
+import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
 import json
-from pathlib import Path
+
+from .settings_store import JsonSettingsStore
 
 
 class Settings:
@@ -7,6 +11,23 @@ class Settings:
         "command_prefix": "/",
     }
 
+    # seconds to wait before writing changed settings to disk, writes in this window are coalesced
+    flush_delay = 1.0
+    # where the settings files are stored, json files by default, or a SqliteSettingsStore
+    store = JsonSettingsStore()
+
+    # in-memory copy of every settings file that has been loaded, keyed on filename
+    _cache: dict[str, dict] = {}
+    # filenames of the cached settings that still need to be written to disk
+    _dirty: set[str] = set()
+    _flush_handle: asyncio.TimerHandle | None = None
+    # a single writer thread, so that consecutive flushes of the same file are written in order
+    _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="settings-writer")
+    cache_hits = 0
+    cache_misses = 0
+    # functions called with (guild_id, setting) after a guild setting has changed
+    _listeners: list = []
+
     @classmethod
     def get(cls, guild_id, setting, default=None):
         settings = cls.load_guild_settings_file(guild_id)
@@ -31,6 +52,7 @@ class Settings:
         # print(f"[ Setting.set ] ({guild_id}) {setting}: {value}")
         settings[setting] = value
         cls.store_guild_settings_file(guild_id, settings)
+        cls.notify_listeners(guild_id, setting)
 
     @classmethod
     def delete(cls, guild_id, setting):
@@ -39,6 +61,16 @@ class Settings:
         if setting in settings:
             del settings[setting]
         cls.store_guild_settings_file(guild_id, settings)
+        cls.notify_listeners(guild_id, setting)
+
+    @classmethod
+    def add_listener(cls, listener):
+        cls._listeners.append(listener)
+
+    @classmethod
+    def notify_listeners(cls, guild_id, setting):
+        for listener in cls._listeners:
+            listener(guild_id, setting)
 
     @classmethod
     def load_guild_settings_file(cls, guild_id):
@@ -51,27 +83,86 @@ class Settings:
 
     @classmethod
     def load_settings_file(cls, filename="data/settings.json"):
-        try:
-            # try to open the settings file with fallback to initial values
-            with open(filename) as f:
-                settings = json.load(f)
-        except:
+        # serve the settings from memory, the file is only read the first time it is requested
+        if filename in cls._cache:
+            cls.cache_hits += 1
+            return cls._cache[filename]
+
+        cls.cache_misses += 1
+        settings = cls.read_settings_file(filename)
+        cls._cache[filename] = settings
+        return settings
+
+    @classmethod
+    def read_settings_file(cls, filename):
+        # try to open the settings file with fallback to initial values
+        settings = cls.store.read(filename)
+        if settings is None:
             print(f"failed to open {filename}, initial values used!")
             settings = {}
             # in case it's the settings.json file, write the default settings file to disk
             if filename == "data/settings.json":
-                Path("data").mkdir(exist_ok=True)  # ensure the data directory exists
-                with open(filename, "w") as f:
-                    json.dump(settings, f)
+                cls.store.write_many({filename: json.dumps(settings)})
 
         return settings
 
     @classmethod
     def store_settings_file(cls, settings, filename="data/settings.json", defaults=None):
         defaults = cls.defaults if defaults is None else defaults
-        with open(filename, "w") as f:
-            Path(filename).parent.mkdir(exist_ok=True)  # ensure the directory exists
-            json.dump({**defaults, **settings}, f, indent=2)
+        # update the in-memory settings, the file on disk is updated by the next flush
+        cls._cache[filename] = {**defaults, **settings}
+        cls._dirty.add(filename)
+        cls.schedule_flush()
+
+    @classmethod
+    def schedule_flush(cls):
+        if cls._flush_handle:
+            # a flush is already pending, this change will be written with it
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # not running in an event loop, write the changes to disk immediately
+            cls.flush()
+            return
+        cls._flush_handle = loop.call_later(cls.flush_delay, cls._flush_in_background)
+
+    @classmethod
+    def _flush_in_background(cls):
+        cls._flush_handle = None
+        # serialize in the event loop, so the writer thread never sees a settings dict that is being changed
+        files = cls._take_dirty_files()
+        cls._writer.submit(cls.store.write_many, files)
+
+    @classmethod
+    def flush(cls):
+        # write all pending changes to disk, blocking until they are written
+        if cls._flush_handle:
+            cls._flush_handle.cancel()
+            cls._flush_handle = None
+        files = cls._take_dirty_files()
+        try:
+            # wait for the already queued writes, so they can't overwrite these changes with older data
+            cls._writer.submit(lambda: None).result()
+        except RuntimeError:
+            pass  # the writer is shut down at interpreter exit, after finishing its queued writes
+        cls.store.write_many(files)
+
+    @classmethod
+    def _take_dirty_files(cls):
+        files = {filename: json.dumps(cls._cache[filename], indent=2) for filename in cls._dirty}
+        cls._dirty.clear()
+        return files
+
+    @classmethod
+    def cache_stats(cls):
+        return {
+            "hits": cls.cache_hits,
+            "misses": cls.cache_misses,
+            "cached": len(cls._cache),
+            "dirty": len(cls._dirty),
+        }
 
     @classmethod
     def on_guild_id(cls, guild_id):
@@ -82,3 +173,7 @@ class Settings:
         if guild_id not in settings["guilds"]:
             settings["guilds"].append(guild_id)
             cls.store_settings_file(settings, defaults={})
+
+
+# make sure that pending changes are written to disk when the bot exits
+atexit.register(Settings.flush)
@@ -0,0 +1,83 @@
+import glob
+import json
+import os
+from pathlib import Path
+import re
+import sqlite3
+import threading
+
+
+# stores every settings file as a json file on disk
+class JsonSettingsStore:
+    def read(self, name: str) -> dict | None:
+        # returns None when the settings file doesn't exist (or is invalid)
+        try:
+            with open(name) as f:
+                return json.load(f)
+        except:
+            return None
+
+    def write_many(self, files: dict[str, str]):
+        for name, data in files.items():
+            try:
+                self.write(name, data)
+            except Exception as e:
+                print(f"failed to write {name}: {e}")
+
+    @staticmethod
+    def write(name: str, data: str):
+        # write to a temporary file first and rename it, so a crash never leaves a half written file behind
+        path = Path(name)
+        path.parent.mkdir(exist_ok=True)  # ensure the directory exists
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# stores every settings file as a row in a single SQLite database, keyed on the settings filename
+class SqliteSettingsStore:
+    def __init__(self, db_path: str = "data/settings.sqlite3", import_json=True):
+        Path(db_path).parent.mkdir(exist_ok=True)  # ensure the directory exists
+        # writes are done from the settings writer thread, the lock keeps them from overlapping with the import
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self._db.commit()
+            is_empty = self._db.execute("SELECT 1 FROM settings LIMIT 1").fetchone() is None
+        # reads are done from the event loop with a read-only connection of their own, so they never wait on a write
+        self._read_db = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+
+        # a new database starts with the settings of the json files (if any)
+        if import_json and is_empty:
+            self.import_json_files()
+
+    def read(self, name: str) -> dict | None:
+        row = self._read_db.execute("SELECT data FROM settings WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_many(self, files: dict[str, str]):
+        # all changed settings are written in a single transaction
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO settings VALUES (?, ?)", files.items())
+
+    def import_json_files(self, global_file="data/settings.json", guild_dir="guild_data"):
+        # one-shot import of the json settings files, settings that already exist in the database are kept
+        names = [global_file]
+        names += [name for name in glob.glob(f"{guild_dir}/*.json") if re.fullmatch(r"[0-9]+\.json", Path(name).name)]
+        json_store = JsonSettingsStore()
+        rows = []
+        for name in names:
+            settings = json_store.read(name)
+            if settings is not None:
+                # use the same name for the row as Settings uses for the file
+                rows.append((Path(name).as_posix(), json.dumps(settings, indent=2)))
+
+        with self._lock:
+            with self._db:
+                self._db.executemany("INSERT OR IGNORE INTO settings VALUES (?, ?)", rows)
+        print(f"imported {len(rows)} settings file(s) into the settings database")
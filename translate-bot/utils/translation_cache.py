@@ -0,0 +1,129 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import sqlite3
+import time
+import unicodedata
+
+
+# cache of translation results, a bounded in-memory LRU in front of an optional SQLite database on disk
+class TranslationCache:
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl: float = 7 * 24 * 3600,
+        db_path: str | None = None,
+        max_db_entries: int = 100_000,
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._max_db_entries = max_db_entries
+        self._puts_since_prune = 0
+        # (src, dst, text) -> (timestamp, translation), ordered from least to most recently used
+        self._entries: OrderedDict[tuple[str, str, str], tuple[float, str]] = OrderedDict()
+        # writes are done from the writer thread with their own connection, and reads from the event loop with
+        # another, in WAL mode the reads don't wait for a commit (or a prune) of the writer
+        self._db: sqlite3.Connection | None = None
+        self._read_db: sqlite3.Connection | None = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="translation-cache-writer")
+        if db_path:
+            self._db = self._open_db(db_path)
+            self._read_db = sqlite3.connect(db_path)
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _open_db(db_path: str):
+        Path(db_path).parent.mkdir(exist_ok=True)  # ensure the directory exists
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "src TEXT NOT NULL, dst TEXT NOT NULL, text TEXT NOT NULL, "
+            "translation TEXT NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (src, dst, text))"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS translations_created ON translations (created)")
+        db.commit()
+        return db
+
+    @staticmethod
+    def normalize(text: str):
+        # texts that only differ in whitespace or unicode composition share a cache entry
+        return unicodedata.normalize("NFC", " ".join(text.split()))
+
+    def get(self, src: str, dst: str, text: str):
+        key = (src, dst, self.normalize(text))
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry:
+            if now - entry[0] < self._ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        if self._read_db:
+            row = self._read_db.execute(
+                "SELECT translation, created FROM translations WHERE src = ? AND dst = ? AND text = ?", key
+            ).fetchone()
+            if row and now - row[1] < self._ttl:
+                self._remember(key, row[1], row[0])
+                self.disk_hits += 1
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, src: str, dst: str, text: str, translation: str):
+        key = (src, dst, self.normalize(text))
+        now = time.time()
+        self._remember(key, now, translation)
+
+        if self._db:
+            # the writer thread finishes its queued writes before the interpreter exits
+            self._writer.submit(self._write, key, translation, now)
+
+    def _write(self, key: tuple[str, str, str], translation: str, now: float):
+        assert self._db
+        try:
+            with self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)", (*key, translation, now)
+                )
+                self._puts_since_prune += 1
+                if self._puts_since_prune >= 256:
+                    self._prune_db(now)
+        except Exception as e:
+            print(f"failed to write to the translation cache: {e}")
+
+    def _prune_db(self, now: float):
+        assert self._db
+        self._puts_since_prune = 0
+        # drop the expired entries and keep the database within its size limit
+        self._db.execute("DELETE FROM translations WHERE created < ?", (now - self._ttl,))
+        self._db.execute(
+            "DELETE FROM translations WHERE rowid IN ("
+            "SELECT rowid FROM translations ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self._max_db_entries,),
+        )
+
+    def _remember(self, key: tuple[str, str, str], timestamp: float, translation: str):
+        self._entries[key] = (timestamp, translation)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,116 @@
+import hashlib
+import io
+import mmap
+import os
+from pathlib import Path
+import random
+import struct
+
+# compiled wordlist layout: header (magic, word count), offset table (count + 1 offsets), utf-8 blob
+_MAGIC = b"WOTDIDX1"
+_HEADER = struct.Struct("<8sI")
+_OFFSET = struct.Struct("<I")
+_COMPILED_DIR = Path("data/wordlists")
+
+
+# read-only wordlist, compiled once to an indexed binary file that is memory mapped and shared by all guilds
+class WordList:
+    def __init__(self, source: str):
+        self.source = source
+        self.compiled = compiled_filename(source)
+        if not _is_up_to_date(self.compiled, source):
+            compile_wordlist(source, self.compiled)
+
+        with open(self.compiled, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count = _HEADER.unpack_from(self._mmap, 0)
+        if magic != _MAGIC:
+            raise ValueError(f"{self.compiled} is not a compiled wordlist!")
+        self._blob_start = _HEADER.size + (self._count + 1) * _OFFSET.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index: int) -> str:
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        start, end = struct.unpack_from("<II", self._mmap, _HEADER.size + index * _OFFSET.size)
+        return self._mmap[self._blob_start + start : self._blob_start + end].decode("utf-8")
+
+    def close(self):
+        self._mmap.close()
+
+
+def compiled_filename(source: str) -> str:
+    return str(_COMPILED_DIR / f"{Path(source).name}.idx")
+
+
+def _is_up_to_date(compiled: str, source: str):
+    return os.path.isfile(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(source)
+
+
+def compile_wordlist(source: str, compiled: str):
+    # every non-empty line of the source file is a word (or a tab separated word pair)
+    with io.open(source, encoding="utf-8-sig") as f:
+        words = [line.rstrip("\r\n").encode("utf-8") for line in f if line.strip()]
+
+    offsets = [0]
+    for word in words:
+        offsets.append(offsets[-1] + len(word))
+
+    # write to a temporary file first and rename it, so a guild never maps a half written file
+    path = Path(compiled)
+    path.parent.mkdir(parents=True, exist_ok=True)  # ensure the directory exists
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, len(words)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(b"".join(words))
+    os.replace(tmp_path, path)
+
+
+# the opened wordlists, keyed on source filename
+_wordlists: dict[str, WordList] = {}
+
+
+def load_wordlist(filename: str) -> WordList:
+    if filename not in _wordlists:
+        _wordlists[filename] = WordList(filename)
+    return _wordlists[filename]
+
+
+def forget_wordlist(filename: str, remove_compiled=False):
+    # call when the source file has changed or is removed, so it is compiled again on the next load
+    wordlist = _wordlists.pop(filename, None)
+    if wordlist:
+        wordlist.close()
+    compiled = compiled_filename(filename)
+    if remove_compiled and os.path.isfile(compiled):
+        os.remove(compiled)
+
+
+def new_seed() -> int:
+    return random.getrandbits(63)
+
+
+def shuffled_index(position: int, size: int, seed: int) -> int:
+    # map position to an index in range(size), every position < size maps to a different index
+    # this is a seeded shuffle of the list that is computed per position, so no permutation is stored:
+    # a balanced feistel network permutes the smallest even-bit domain that contains size, and
+    # results outside of range(size) are permuted again (cycle walking) until they are inside it
+    assert 0 <= position < size
+    half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half_bits) - 1
+    key = seed.to_bytes(8, "little")
+
+    index = position
+    while True:
+        left, right = index >> half_bits, index & mask
+        for feistel_round in range(4):
+            digest = hashlib.blake2b(
+                right.to_bytes(8, "little"), digest_size=8, key=key, salt=bytes([feistel_round]) * 16
+            )
+            left, right = right, left ^ (int.from_bytes(digest.digest(), "little") & mask)
+        index = (left << half_bits) | right
+        if index < size:
+            return index